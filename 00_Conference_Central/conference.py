@@ -14,44 +14,133 @@ __author__ = 'wesc+api@google.com (Wesley Chun)'
 
 
 from datetime import datetime
+import hashlib
+import heapq
+import random
+import re
+import time
 
 import endpoints
 from protorpc import messages
 from protorpc import message_types
+from protorpc import protojson
 from protorpc import remote
 
+from google.appengine.api import datastore_errors
 from google.appengine.api import memcache
 from google.appengine.api import taskqueue
+from google.appengine.datastore.datastore_query import Cursor
 from google.appengine.ext import ndb
 
 from models import ConflictException
 from models import Profile
 from models import ProfileMiniForm
 from models import ProfileForm
+from models import Announcement
 from models import BooleanMessage
+from models import RegistrationForm
+from models import RegistrationRequest
 from models import Conference
 from models import ConferenceForm
 from models import ConferenceForms
 from models import ConferenceQueryForm
 from models import ConferenceQueryForms
+from models import ConferenceSearchIndex
+from models import ConferenceStats
+from models import ConferenceStatsForm
+from models import StatCountForm
+from models import SeatShard
 from models import TeeShirtSize
 from models import Session
 from models import SessionForm
 from models import SessionForms
+from models import SessionErrorForm
+from models import SessionBatchForm
+from models import SessionConflictForm
+from models import SessionConflictForms
+from models import SessionQueryForms
 from models import WishList
 
+from mappers import dictMapper
+from mappers import modelMapper
+from metrics import instrument
+from outbox import outboxMail
+from outbox import scheduleOutbox
+from tracing import trace
+
+from utils import addCoalescedTask
+from utils import countCacheLookup
 from utils import getUserId
 
 from settings import WEB_CLIENT_ID
 
 from models import StringMessage
 
-import pickle
 import json
 
+CONFERENCE_TO_FORM = modelMapper(Conference, ConferenceForm,
+                                 websafeKey=lambda conf: conf.key.urlsafe())
+PROFILE_TO_FORM = modelMapper(Profile, ProfileForm)
+SESSION_TO_FORM = modelMapper(Session, SessionForm,
+                              websafeKey=lambda session: session.key.urlsafe())
+SESSION_DATA_TO_FORM = dictMapper(Session, SessionForm)
+
 EMAIL_SCOPE = endpoints.EMAIL_SCOPE
 API_EXPLORER_CLIENT_ID = endpoints.API_EXPLORER_CLIENT_ID
 MEMCACHE_ANNOUNCEMENTS_KEY = "RECENT_ANNOUNCEMENTS"
+MEMCACHE_NEARLY_SOLD_OUT_KEY = "NEARLY_SOLD_OUT"
+ANNOUNCEMENT_KEY = ndb.Key(Announcement, 'nearly_sold_out')
+NEARLY_SOLD_OUT_SEATS = 5
+MEMCACHE_FEATURED_SPEAKERS_KEY = "FEATURED_SPEAKERS:%s"
+FEATURED_SPEAKER_SESSIONS = 2
+FEATURED_SPEAKER_INTERVAL = 5   # seconds a speaker's session creates are coalesced
+MAX_SESSION_BATCH = 500
+MEMCACHE_CAS_RETRIES = 5
+MEMCACHE_CONF_QUERY_GENERATION_KEY = "CONFERENCE_QUERY_GENERATION"
+MEMCACHE_CONF_QUERY_KEY = "QUERY_CONFERENCES_V2:%d:%s"  # (forms, seat shards)
+MEMCACHE_SEARCH_KEY = "SEARCH_CONFERENCES:%d:%s"         # (ranked conference keys, truncated)
+CONF_QUERY_CACHE_TIME = 600   # seconds
+QUERY_CONFERENCES_CACHE = 'queryConferences'
+MEMCACHE_PROFILE_KEY = "PROFILE:%s"
+PROFILE_CACHE_TIME = 3600   # seconds
+PROFILE_LOCK_TIME = 5       # seconds a written profile refuses cache fills
+PROFILE_CACHE = 'profile'
+MEMCACHE_SESSIONS_VERSION_KEY = "CONFERENCE_SESSIONS_VERSION:%s"
+MEMCACHE_SESSIONS_KEY = "CONFERENCE_SESSIONS:%s:%d"
+SESSIONS_CACHE_TIME = 3600  # seconds
+CONFERENCE_SESSIONS_CACHE = 'conferenceSessions'
+CACHE_NAMES = (QUERY_CONFERENCES_CACHE, PROFILE_CACHE, CONFERENCE_SESSIONS_CACHE)
+MEMCACHE_SEATS_KEY = "SEATS_AVAILABLE:%s"
+SEATS_CACHE_TIME = 60       # seconds
+SEAT_SHARDS = 20            # at most 20 so shards + conference fit one xg transaction
+SEATS_SYNC_INTERVAL = 10    # seconds between Conference.seatsAvailable write-backs
+REGISTRATION_QUEUE = 'registrations'      # pull queue, tasks tagged by websafe conference key
+REGISTRATION_BATCH_SIZE = 500
+REGISTRATION_LEASE_TIME = 120   # seconds
+REGISTRATION_DRAIN_INTERVAL = 5 # seconds
+REGISTRATION_TXN_PARALLELISM = 10   # seat transactions the drainer runs at once
+STATS_QUEUE = 'conference-stats'   # pull queue of stats deltas, tagged by websafe conference key
+STATS_BATCH_SIZE = 500
+STATS_LEASE_TIME = 60           # seconds
+STATS_APPLY_INTERVAL = 5        # seconds deltas are collected before they are applied
+STATS_REPAIR_BATCH_SIZE = 100
+STATS_REPAIR_INTERVAL = 60      # seconds between repairs queued for missing stats
+STATS_REPAIR_TIMEOUT = 3600     # seconds after which a repair counts as abandoned
+STATS_FIELDS = ('seatsSold', 'sessionsByType', 'speakers', 'wishlists')
+PENDING = 'PENDING'
+REGISTERED = 'REGISTERED'
+SOLD_OUT = 'SOLD_OUT'
+NOT_REGISTERED = 'NOT_REGISTERED'
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+# conference search index: words are indexed with all their prefixes of
+# SEARCH_MIN_PREFIX..SEARCH_MAX_PREFIX characters; name words weigh more
+SEARCH_MIN_PREFIX = 2
+SEARCH_MAX_PREFIX = 15
+SEARCH_MAX_HITS = 1000
+SEARCH_NAME_WEIGHT = 3
+SEARCH_DESCRIPTION_WEIGHT = 1
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
@@ -60,6 +149,7 @@ DEFAULTS = {
     "maxAttendees": 0,
     "seatsAvailable": 0,
     "topics": [ "Default", "Topic" ],
+    "ticketDrop": False,
 }
 
 OPERATORS = {
@@ -78,6 +168,15 @@ FIELDS = {
          'MAX_ATTENDEES': 'maxAttendees',
          }
 
+SESSION_FIELDS = {
+         'TYPE': 'typeOfSession',
+         'SPEAKER': 'speaker',
+         'DATE': 'date',
+         'START_HOUR': 'startHour',
+         'IS_WORKSHOP': 'isWorkshop',
+         }
+SESSION_RANGE_FIELD = 'startHour'    # the only session property with range indexes
+
 CONF_GET_REQUEST = endpoints.ResourceContainer(
     message_types.VoidMessage,
     websafeConferenceKey=messages.StringField(1),
@@ -93,6 +192,11 @@ SESSION_POST_REQUEST = endpoints.ResourceContainer(
     websafeConferenceKey=messages.StringField(1),
 )
 
+SESSIONS_POST_REQUEST = endpoints.ResourceContainer(
+    SessionForms,
+    websafeConferenceKey=messages.StringField(1),
+)
+
 SESSION_BY_TYP_REQUEST = endpoints.ResourceContainer(
     websafeConferenceKey=messages.StringField(1),
     typeOfSession=messages.StringField(2)
@@ -102,16 +206,43 @@ FEATURED_SPEAKER_FOR_CONF = endpoints.ResourceContainer(
     webSafeConferenceKey=messages.StringField(1)
 )
 
+SESSION_QUERY_REQUEST = endpoints.ResourceContainer(
+    SessionQueryForms,
+    websafeConferenceKey=messages.StringField(1),
+)
+
+SESSION_TIME_RANGE_REQUEST = endpoints.ResourceContainer(
+    websafeConferenceKey=messages.StringField(1, required=True),
+    start=messages.StringField(2, required=True),
+    end=messages.StringField(3, required=True),
+    pageSize=messages.IntegerField(4, variant=messages.Variant.INT32),
+    pageToken=messages.StringField(5),
+)
+
+NON_WORKSHOP_REQUEST = endpoints.ResourceContainer(
+    websafeConferenceKey=messages.StringField(1, required=True),
+)
+
 SESSION_BY_SPK_REQUEST = endpoints.ResourceContainer(
     speaker=messages.StringField(1)
 )
 
 CONF_BY_CONTXT_REQUEST = endpoints.ResourceContainer(
-    containsTxt=messages.StringField(1)
+    containsTxt=messages.StringField(1),
+    pageSize=messages.IntegerField(2, variant=messages.Variant.INT32),
+    pageToken=messages.StringField(3),
 )
 
 CONF_BY_MNTH_REQUEST = endpoints.ResourceContainer(
-    month=messages.IntegerField(1)
+    month=messages.IntegerField(1),
+    pageSize=messages.IntegerField(2, variant=messages.Variant.INT32),
+    pageToken=messages.StringField(3),
+)
+
+CONF_PAGE_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    pageSize=messages.IntegerField(1, variant=messages.Variant.INT32),
+    pageToken=messages.StringField(2),
 )
 
 WISHLIST_POST_REQUEST = endpoints.ResourceContainer(
@@ -124,6 +255,8 @@ WISHLIST_POST_REQUEST = endpoints.ResourceContainer(
 @endpoints.api(name='conference', version='v1',
     allowed_client_ids=[WEB_CLIENT_ID, API_EXPLORER_CLIENT_ID],
     scopes=[EMAIL_SCOPE])
+@instrument
+@trace
 class ConferenceApi(remote.Service):
     """Conference API v0.1"""
 
@@ -131,19 +264,9 @@ class ConferenceApi(remote.Service):
 
     def _copyConferenceToForm(self, conf, displayName):
         """Copy relevant fields from Conference to ConferenceForm."""
-        cf = ConferenceForm()
-        for field in cf.all_fields():
-            if hasattr(conf, field.name):
-                # convert Date to date string; just copy others
-                if field.name.endswith('Date'):
-                    setattr(cf, field.name, str(getattr(conf, field.name)))
-                else:
-                    setattr(cf, field.name, getattr(conf, field.name))
-            elif field.name == "websafeKey":
-                setattr(cf, field.name, conf.key.urlsafe())
+        cf = CONFERENCE_TO_FORM(conf)
         if displayName:
-            setattr(cf, 'organizerDisplayName', displayName)
-        cf.check_initialized()
+            cf.organizerDisplayName = displayName
         return cf
 
     def _createConferenceObject(self, request):
@@ -187,19 +310,32 @@ class ConferenceApi(remote.Service):
         c_key = ndb.Key(Conference, c_id, parent=p_key)
         data['key'] = c_key
         data['organizerUserId'] = request.organizerUserId = user_id
-
-        # create Conference, send email to organizer confirming
-        # creation of Conference & return (modified) ConferenceForm
-        Conference(**data).put()
-        # TODO 2: add confirmation email sending task to queue
-        taskqueue.add(params={'email': user.email(),
-                      'conferenceInfo': repr(request)},
-                      url='/tasks/send_confirmation_email'
-                      )
+        data['seatShards'] = min(SEAT_SHARDS, max(1, data['seatsAvailable']))
+
+        # create Conference, its search index entry & seat shards, and the
+        # outbox email confirming creation to the organizer; return (modified)
+        # ConferenceForm
+        conf = Conference(**data)
+        ndb.put_multi([conf, self._buildSearchIndex(conf), ConferenceStats(key=self._statsKey(c_key)),
+                       self._confirmationMail(user.email(), conf)] +
+                      self._buildSeatShards(conf, conf.seatsAvailable))
+        self._invalidateConferenceQueries()
+        scheduleOutbox()
         return request
 
-    @ndb.transactional()
+    @staticmethod
+    def _confirmationMail(email, conf):
+        """Return the outbox mail confirming creation of conf."""
+        return outboxMail(
+            email, 'You created a new Conference!', 'You created %d new Conferences!',
+            'Hi, you have created the following conference:\r\n\r\n'
+            '%s\r\n%s, %s to %s\r\n%s' % (
+                conf.name, conf.city, conf.startDate or 'TBA', conf.endDate or 'TBA',
+                conf.description or ''))
+
+    @ndb.transactional(xg=True)
     def _updateConferenceObject(self, request):
+        """Update a Conference from request; return it and its ConferenceForm."""
         user = endpoints.get_current_user()
         if not user:
             raise endpoints.UnauthorizedException('Authorization required')
@@ -208,8 +344,12 @@ class ConferenceApi(remote.Service):
         # copy ConferenceForm/ProtoRPC Message into dict
         data = {field.name: getattr(request, field.name) for field in request.all_fields()}
 
-        # update existing conference
-        conf = ndb.Key(urlsafe=request.websafeConferenceKey).get()
+        # update existing conference; its organizer's profile (for the display
+        # name) is its parent, so read both at once
+        conf_key = ndb.Key(urlsafe=request.websafeConferenceKey)
+        conf_future = conf_key.get_async()
+        prof_future = self._getProfilesAsync([conf_key.parent().id()])
+        conf = conf_future.get_result()
         # check that conference exists
         if not conf:
             raise endpoints.NotFoundException(
@@ -222,8 +362,12 @@ class ConferenceApi(remote.Service):
 
         # Not getting all the fields, so don't create a new object; just
         # copy relevant fields from ConferenceForm to Conference object
+        old_max = conf.maxAttendees or 0
         for field in request.all_fields():
             data = getattr(request, field.name)
+            # seats of a sharded conference are maintained by its shards
+            if field.name == 'seatsAvailable' and conf.seatShards:
+                continue
             # only copy fields where we get data
             if data not in (None, []):
                 # special handling for dates (convert string to Date)
@@ -233,9 +377,13 @@ class ConferenceApi(remote.Service):
                         conf.month = data.month
                 # write to Conference object
                 setattr(conf, field.name, data)
-        conf.put()
-        prof = ndb.Key(Profile, user_id).get()
-        return self._copyConferenceToForm(conf, getattr(prof, 'displayName'))
+        if conf.seatShards and (conf.maxAttendees or 0) != old_max:
+            conf.seatsAvailable = self._adjustSeatShards(conf, (conf.maxAttendees or 0) - old_max)
+        # the search index is a child of conf, so it commits atomically with it
+        ndb.put_multi([conf, self._buildSearchIndex(conf)])
+        self._invalidateConferenceQueries()
+        prof = prof_future.get_result()[conf_key.parent().id()]
+        return conf, self._copyConferenceToForm(conf, getattr(prof, 'displayName'))
 
     @endpoints.method(ConferenceForm, ConferenceForm, path='conference',
             http_method='POST', name='createConference')
@@ -248,7 +396,12 @@ class ConferenceApi(remote.Service):
             http_method='PUT', name='updateConference')
     def updateConference(self, request):
         """Update conference w/provided fields & return w/updated info."""
-        return self._updateConferenceObject(request)
+        conf, cf = self._updateConferenceObject(request)
+        # name or seats may have changed; seatsAvailable of a sharded
+        # conference lags behind its shards, so count those
+        cf.seatsAvailable = self._getSeatsAvailable(conf)
+        self._noteSeatsAvailable(cf.websafeKey, cf.name, cf.seatsAvailable)
+        return cf
 
     @endpoints.method(CONF_GET_REQUEST, ConferenceForm,
             path='conference/{websafeConferenceKey}',
@@ -256,19 +409,33 @@ class ConferenceApi(remote.Service):
     def getConference(self, request):
         """Return requested conference (by websafeConferenceKey)."""
         # get Conference object from request; bail if not found
-        conf = ndb.Key(urlsafe=request.websafeConferenceKey).get()
+        conf, prof, seats = self._getConferenceAsync(
+            ndb.Key(urlsafe=request.websafeConferenceKey)).get_result()
         if not conf:
             raise endpoints.NotFoundException(
                 'No conference found with key: %s' % request.websafeConferenceKey)
-        prof = conf.key.parent().get()
+        if conf.seatShards:
+            conf.seatsAvailable = seats if seats is not None else self._getSeatsAvailable(conf)
         # return ConferenceForm
         return self._copyConferenceToForm(conf, getattr(prof, 'displayName'))
 
-    @endpoints.method(message_types.VoidMessage, ConferenceForms,
+    @ndb.tasklet
+    def _getConferenceAsync(self, conf_key):
+        """Return (Conference, organizer Profile, cached seats available) of
+        conf_key, read concurrently; the organizer is the key's parent, and
+        the memcache lookups share one batch."""
+        user_id = conf_key.parent().id()
+        conf, profiles, seats = yield (
+            conf_key.get_async(),
+            self._getProfilesAsync([user_id]),
+            ndb.get_context().memcache_get(MEMCACHE_SEATS_KEY % conf_key.urlsafe()))
+        raise ndb.Return(conf, profiles[user_id], seats)
+
+    @endpoints.method(CONF_PAGE_REQUEST, ConferenceForms,
             path='getConferencesCreated',
             http_method='POST', name='getConferencesCreated')
     def getConferencesCreated(self, request):
-        """Return conferences created by user."""
+        """Return conferences created by user, one page at a time."""
         # make sure user is authed
         user = endpoints.get_current_user()
         if not user:
@@ -276,11 +443,68 @@ class ConferenceApi(remote.Service):
         user_id = getUserId(user)
         # create ancestor query for all key matches for this user
         confs = Conference.query(ancestor=ndb.Key(Profile, user_id))
-        prof = ndb.Key(Profile, user_id).get()
+        conf_keys, next_token = self._fetchPage(
+            confs.order(Conference.key), request, keys_only=True)
         # return set of ConferenceForm objects per Conference
-        return ConferenceForms(
-            items=[self._copyConferenceToForm(conf, getattr(prof, 'displayName')) for conf in confs]
-        )
+        return self._conferenceForms(conf_keys, next_token)
+
+    def _fetchPage(self, query, request, keys_only=False):
+        """Fetch one page of query results using request pageSize/pageToken.
+
+        Returns (results, nextPageToken); the token is None on the last page.
+        """
+        page_size = request.pageSize or DEFAULT_PAGE_SIZE
+        if not 0 < page_size <= MAX_PAGE_SIZE:
+            raise endpoints.BadRequestException(
+                "pageSize must be between 1 and %d." % MAX_PAGE_SIZE)
+        try:
+            cursor = Cursor(urlsafe=request.pageToken) if request.pageToken else None
+            results, next_cursor, more = query.fetch_page(
+                page_size, start_cursor=cursor, keys_only=keys_only)
+        except (datastore_errors.BadValueError, datastore_errors.BadRequestError):
+            raise endpoints.BadRequestException("Invalid pageToken.")
+        next_token = next_cursor.urlsafe() if more and next_cursor else None
+        return results, next_token
+
+    def _conferenceForms(self, conf_keys, next_token=None):
+        """Return ConferenceForms for conf_keys (skipping deleted conferences)."""
+        return self._conferencePage(conf_keys, next_token)[0]
+
+    def _conferencePage(self, conf_keys, next_token=None):
+        """Return ConferenceForms for conf_keys (skipping deleted conferences)
+        and {websafe key: number of seat shards} of the sharded ones.
+
+        A Conference is always a child of its organizer's Profile, so the
+        deduplicated organizer profiles are looked up (profile cache first)
+        alongside the batch get of the conferences, not after it.
+        """
+        conf_futures = ndb.get_multi_async(conf_keys)
+        profiles = self._getProfilesAsync(key.parent().id() for key in conf_keys)
+
+        # put display names in a dict for easier fetching
+        names = {}
+        for user_id, prof in profiles.get_result().iteritems():
+            names[user_id] = getattr(prof, 'displayName', None)
+
+        confs = [future.get_result() for future in conf_futures]
+        seat_shards = dict((conf.key.urlsafe(), conf.seatShards)
+                           for conf in confs if conf and conf.seatShards)
+
+        forms = ConferenceForms(nextPageToken=next_token)
+        for conf in confs:
+            if conf:
+                forms.items.append(
+                    self._copyConferenceToForm(conf, names[conf.key.parent().id()]))
+        self._setSeatsAvailable(forms, seat_shards)
+        return forms, seat_shards
+
+    def _setSeatsAvailable(self, forms, seat_shards):
+        """Set seatsAvailable of the sharded conferences in forms, given as
+        {websafe key: number of seat shards}, to their shard totals."""
+        seats = self._getSeatsAvailableMulti(seat_shards)
+        for cf in forms.items:
+            if cf.websafeKey in seats:
+                cf.seatsAvailable = seats[cf.websafeKey]
 
     def _getQuery(self, request):
         """Return formatted query from the submitted filters."""
@@ -295,11 +519,10 @@ class ConferenceApi(remote.Service):
             q = q.order(Conference.name)
 
         for filtr in filters:
-            if filtr["field"] in ["month", "maxAttendees"]:
-                filtr["value"] = int(filtr["value"])
             formatted_query = ndb.query.FilterNode(filtr["field"], filtr["operator"], filtr["value"])
             q = q.filter(formatted_query)
-        return q
+        # order by key last so page cursors stay stable (also for "!=" queries)
+        return q.order(Conference.key)
 
     def _formatFilters(self, filters):
         """Parse, check validity and format user supplied filters."""
@@ -315,6 +538,13 @@ class ConferenceApi(remote.Service):
             except KeyError:
                 raise endpoints.BadRequestException("Filter contains invalid field or operator.")
 
+            if filtr["field"] in ["month", "maxAttendees"]:
+                try:
+                    filtr["value"] = int(filtr["value"])
+                except (TypeError, ValueError):
+                    raise endpoints.BadRequestException(
+                        "Filter value for %s must be a number." % filtr["field"])
+
             # Every operation except "=" is an inequality
             if filtr["operator"] != "=":
                 # check if inequality operation has been used in previous filters
@@ -333,50 +563,158 @@ class ConferenceApi(remote.Service):
             http_method='POST',
             name='queryConferences')
     def queryConferences(self, request):
-        """Query for conferences."""
-        conferences = self._getQuery(request)
+        """Query for conferences, one page at a time; pages are cached.
+
+        Seat counts change with every registration, so cached pages keep
+        each sharded conference's number of shards and get current seat
+        counts from the seat cache when served.
+        """
+        cache_key = self._conferenceQueryCacheKey(request)
+        cached = memcache.get(cache_key)
+        countCacheLookup(QUERY_CONFERENCES_CACHE, cached is not None)
+        if cached is not None:
+            encoded, seat_shards = cached
+            forms = protojson.decode_message(ConferenceForms, encoded)
+            self._setSeatsAvailable(forms, seat_shards)
+            return forms
+
+        conf_keys, next_token = self._fetchPage(
+            self._getQuery(request), request, keys_only=True)
+        # return individual ConferenceForm object per Conference
+        forms, seat_shards = self._conferencePage(conf_keys, next_token)
+        memcache.set(cache_key, (protojson.encode_message(forms), seat_shards),
+                     time=CONF_QUERY_CACHE_TIME)
+        return forms
 
-        # need to fetch organiser displayName from profiles
-        # get all keys and use get_multi for speed
-        organisers = [(ndb.Key(Profile, conf.organizerUserId)) for conf in conferences]
-        profiles = ndb.get_multi(organisers)
+    def _conferenceQueryCacheKey(self, request):
+        """Return the result cache key of a queryConferences request.
 
-        # put display names in a dict for easier fetching
-        names = {}
-        for profile in profiles:
-            names[profile.key.id()] = profile.displayName
+        Filters are normalized (field and operator names resolved, numbers
+        parsed) and sorted, so equivalent requests share one cache entry.
+        """
+        filters = sorted((f["field"], f["operator"], f["value"])
+                         for f in self._formatFilters(request.filters)[1])
+        canonical = json.dumps([filters, request.pageSize or DEFAULT_PAGE_SIZE,
+                                request.pageToken or ''])
+        return MEMCACHE_CONF_QUERY_KEY % (self._conferenceQueryGeneration(),
+                                          hashlib.md5(canonical).hexdigest())
 
-        # return individual ConferenceForm object per Conference
-        return ConferenceForms(
-                items=[self._copyConferenceToForm(conf, names[conf.organizerUserId]) for conf in \
-                conferences]
-        )
+    @staticmethod
+    def _conferenceQueryGeneration():
+        """Return the current generation of cached conference queries."""
+        generation = memcache.get(MEMCACHE_CONF_QUERY_GENERATION_KEY)
+        if generation is None:
+            # start from a clock value so that entries cached under an evicted
+            # counter's generations are never served again
+            memcache.add(MEMCACHE_CONF_QUERY_GENERATION_KEY, int(time.time() * 1000000))
+            generation = memcache.get(MEMCACHE_CONF_QUERY_GENERATION_KEY) or 0
+        return generation
+
+    @staticmethod
+    def _invalidateConferenceQueries():
+        """Start a new generation of cached conference queries, after the
+        current transaction (if any) commits."""
+        ndb.get_context().call_on_commit(
+            lambda: memcache.incr(MEMCACHE_CONF_QUERY_GENERATION_KEY))
+
+    @staticmethod
+    def _searchWords(text):
+        """Split text into lower-case words."""
+        return re.findall(r'\w+', (text or '').lower(), re.UNICODE)
+
+    @staticmethod
+    def _buildSearchIndex(conf):
+        """Return the ConferenceSearchIndex entity for (unsaved) conf."""
+        weights = {}
+        for text, weight in ((conf.name, SEARCH_NAME_WEIGHT),
+                             (conf.description, SEARCH_DESCRIPTION_WEIGHT)):
+            for word in ConferenceApi._searchWords(text):
+                weights[word] = weights.get(word, 0) + weight
+        terms = set()
+        for word in weights:
+            for size in range(SEARCH_MIN_PREFIX, min(len(word), SEARCH_MAX_PREFIX) + 1):
+                terms.add(word[:size])
+        return ConferenceSearchIndex(key=ndb.Key(ConferenceSearchIndex, 1, parent=conf.key),
+                                     terms=sorted(terms), weights=weights)
+
+    @staticmethod
+    def _searchScore(index, words):
+        """Score index against query words; exact word matches rank highest."""
+        score = 0.0
+        for query_word in words:
+            best = 0.0
+            for word, weight in index.weights.iteritems():
+                if word.startswith(query_word):
+                    best = max(best, weight * float(len(query_word)) / len(word))
+            score += best
+        return score
+
+    @staticmethod
+    def _rebuildSearchIndex(cursor=None, batch_size=100):
+        """(Re)index one batch of conferences; return the cursor to continue
+        from, or None when done. Used by the rebuild_conference_index task."""
+        confs, next_cursor, more = Conference.query().fetch_page(
+            batch_size, start_cursor=Cursor(urlsafe=cursor) if cursor else None)
+        ndb.put_multi([ConferenceApi._buildSearchIndex(conf) for conf in confs])
+        return next_cursor.urlsafe() if more and next_cursor else None
 
     @endpoints.method(CONF_BY_CONTXT_REQUEST, ConferenceForms,
                       path='conferences/contains/{containsTxt}',
                       http_method='GET', name='getConferenceByConTxt')
     def getConferenceByConTxt(self, request):
         """
-        Search for Conference using text in Conference Name or Description.
+        Search for Conference using words (or word prefixes) in Conference Name or
+        Description. Results are ranked by relevance and paginated.
         """
-        confs = Conference.query()
-
-        # need to fetch organiser displayName from profiles
-        # get all keys and use get_multi for speed
-        organisers = [(ndb.Key(Profile, conf.organizerUserId)) for conf in confs]
-        profiles = ndb.get_multi(organisers)
-
-        # put display names in a dict for easier fetching
-        names = {}
-        for profile in profiles:
-            names[profile.key.id()] = profile.displayName
-
-        return ConferenceForms\
-            (items=[self._copyConferenceToForm(conf, names[conf.organizerUserId])
-                    for conf in confs
-                    if any(request.containsTxt.lower() in Text for Text in
-                           [conf.name.lower(), str(conf.description or "NoneNoneNoneNone").lower()])]
-             )
+        words = [word[:SEARCH_MAX_PREFIX] for word in self._searchWords(request.containsTxt)
+                 if len(word) >= SEARCH_MIN_PREFIX]
+        if not words:
+            raise endpoints.BadRequestException(
+                "Search text needs a word of at least %d characters." % SEARCH_MIN_PREFIX)
+
+        page_size = request.pageSize or DEFAULT_PAGE_SIZE
+        if not 0 < page_size <= MAX_PAGE_SIZE:
+            raise endpoints.BadRequestException(
+                "pageSize must be between 1 and %d." % MAX_PAGE_SIZE)
+        try:
+            offset = int(request.pageToken or 0)
+        except ValueError:
+            offset = -1
+        if offset < 0:
+            raise endpoints.BadRequestException("Invalid pageToken.")
+
+        conf_keys, truncated = self._searchRanking(words)
+
+        # fetch conferences & organizer profiles for this page of hits only
+        next_token = str(offset + page_size) if len(conf_keys) > offset + page_size else None
+        forms = self._conferenceForms(conf_keys[offset:offset + page_size], next_token)
+        forms.truncated = truncated or None
+        return forms
+
+    def _searchRanking(self, words):
+        """Return ([conference key], truncated): the conferences matching
+        words, best first, and whether matches past SEARCH_MAX_HITS were left
+        out. Rankings are cached with the conference query generation, so a
+        search reads the index entries once rather than once per page."""
+        canonical = json.dumps(sorted(words))
+        cache_key = MEMCACHE_SEARCH_KEY % (self._conferenceQueryGeneration(),
+                                           hashlib.md5(canonical).hexdigest())
+        cached = memcache.get(cache_key)
+        if cached is not None:
+            websafe_keys, truncated = cached
+            return [ndb.Key(urlsafe=wsck) for wsck in websafe_keys], truncated
+
+        # only index entries of matching conferences are read
+        query = ConferenceSearchIndex.query(
+            *[ConferenceSearchIndex.terms == word for word in set(words)])
+        hits = query.fetch(SEARCH_MAX_HITS + 1)
+        truncated = len(hits) > SEARCH_MAX_HITS
+        hits = hits[:SEARCH_MAX_HITS]
+        hits.sort(key=lambda index: (-self._searchScore(index, words), index.key))
+        conf_keys = [index.key.parent() for index in hits]
+        memcache.set(cache_key, ([key.urlsafe() for key in conf_keys], truncated),
+                     time=CONF_QUERY_CACHE_TIME)
+        return conf_keys, truncated
 
     @endpoints.method(CONF_BY_MNTH_REQUEST, ConferenceForms,
                       path='conferences/month/{month}',
@@ -386,38 +724,17 @@ class ConferenceApi(remote.Service):
         Get Conference By Month. Accepts Integer value for Month.
         Only works when Organizer has provided Start Date while Creating Conference.
         """
-        print request.month
         confs = Conference.query(Conference.month == request.month)
-        print confs
-        # need to fetch organiser displayName from profiles
-        # get all keys and use get_multi for speed
-        organisers = [(ndb.Key(Profile, conf.organizerUserId)) for conf in confs]
-        profiles = ndb.get_multi(organisers)
-
-        # put display names in a dict for easier fetching
-        names = {}
-        for profile in profiles:
-            names[profile.key.id()] = profile.displayName
-
-        return ConferenceForms(
-            items=[self._copyConferenceToForm(conf, names[conf.organizerUserId])
-                   for conf in confs])
+        conf_keys, next_token = self._fetchPage(
+            confs.order(Conference.key), request, keys_only=True)
+        return self._conferenceForms(conf_keys, next_token)
 
     # - - - Profile objects - - - - - - - - - - - - - - - - - - -
 
     def _copyProfileToForm(self, prof):
         """Copy relevant fields from Profile to ProfileForm."""
-        # copy relevant fields from Profile to ProfileForm
-        pf = ProfileForm()
-        for field in pf.all_fields():
-            if hasattr(prof, field.name):
-                # convert t-shirt string to Enum; just copy others
-                if field.name == 'teeShirtSize':
-                    setattr(pf, field.name, getattr(TeeShirtSize, getattr(prof, field.name)))
-                else:
-                    setattr(pf, field.name, getattr(prof, field.name))
-        pf.check_initialized()
-        return pf
+        # t-shirt string becomes the TeeShirtSize enum
+        return PROFILE_TO_FORM(prof)
 
     def _getProfileFromUser(self):
         """Return user Profile from datastore, creating new one if non-existent."""
@@ -426,22 +743,81 @@ class ConferenceApi(remote.Service):
         if not user:
             raise endpoints.UnauthorizedException('Authorization required')
 
-        # get Profile from datastore
+        # get Profile from cache or datastore
         user_id = getUserId(user)
-        p_key = ndb.Key(Profile, user_id)
-        profile = p_key.get()
+        profile = self._getProfile(user_id)
         # create new Profile if not there
         if not profile:
             profile = Profile(
-                key = p_key,
+                key = ndb.Key(Profile, user_id),
                 displayName = user.nickname(),
                 mainEmail= user.email(),
                 teeShirtSize = str(TeeShirtSize.NOT_SPECIFIED),
             )
             profile.put()
+            self._cacheProfiles([profile])
 
         return profile      # return Profile
 
+    def _getProfile(self, user_id):
+        """Return the Profile of user_id, or None if there is none."""
+        return self._getProfilesAsync([user_id]).get_result()[user_id]
+
+    @ndb.tasklet
+    def _getProfilesAsync(self, user_ids):
+        """Return {user_id: Profile or None} for user_ids.
+
+        Looks in this request's profiles, then memcache, then the datastore,
+        filling both cache tiers. Transactions always read the datastore.
+        Fills only add to memcache, so they never replace a newer entry and
+        are refused for a while after a profile is written.
+        """
+        user_ids = list(set(user_ids))
+        if ndb.in_transaction():
+            profs = yield ndb.get_multi_async([ndb.Key(Profile, user_id) for user_id in user_ids])
+            raise ndb.Return(dict(zip(user_ids, profs)))
+
+        ctx = ndb.get_context()
+        profiles = self._requestProfiles()
+        found = dict((user_id, profiles[user_id]) for user_id in user_ids if user_id in profiles)
+        missing = [user_id for user_id in user_ids if user_id not in found]
+        if missing:
+            cached = yield [ctx.memcache_get(MEMCACHE_PROFILE_KEY % user_id) for user_id in missing]
+            found.update((user_id, prof) for user_id, prof in zip(missing, cached) if prof)
+            missing = [user_id for user_id in missing if user_id not in found]
+        for user_id in user_ids:
+            countCacheLookup(PROFILE_CACHE, user_id not in missing)
+
+        if missing:
+            profs = yield ndb.get_multi_async([ndb.Key(Profile, user_id) for user_id in missing])
+            found.update(zip(missing, profs))
+            yield [ctx.memcache_add(MEMCACHE_PROFILE_KEY % prof.key.id(), prof, time=PROFILE_CACHE_TIME)
+                   for prof in profs if prof]
+        profiles.update(found)
+        raise ndb.Return(found)
+
+    def _requestProfiles(self):
+        """Return this request's user_id -> Profile cache (the first tier)."""
+        if not hasattr(self, '_profiles'):
+            self._profiles = {}
+        return self._profiles
+
+    def _cacheProfiles(self, profiles):
+        """Once the current transaction, if any, commits, put profiles in
+        this request's cache and drop them from memcache."""
+        def write():
+            self._requestProfiles().update((prof.key.id(), prof) for prof in profiles)
+            ConferenceApi._uncacheProfiles([prof.key.id() for prof in profiles])
+        ndb.get_context().call_on_commit(write)
+
+    @staticmethod
+    def _uncacheProfiles(user_ids):
+        """Drop profiles from the memcache tier of the profile cache, refusing
+        fills for PROFILE_LOCK_TIME so a read that started before the write
+        can't put the old profile back."""
+        memcache.delete_multi(user_ids, seconds=PROFILE_LOCK_TIME,
+                              key_prefix=MEMCACHE_PROFILE_KEY % '')
+
     def _doProfile(self, save_request=None):
         """Get user Profile and return to user, possibly updating it first."""
         # get user Profile
@@ -459,6 +835,7 @@ class ConferenceApi(remote.Service):
                         #else:
                         #    setattr(prof, field, val)
             prof.put()
+            self._cacheProfiles([prof])
 
         # return ProfileForm
         return self._copyProfileToForm(prof)
@@ -478,10 +855,8 @@ class ConferenceApi(remote.Service):
 
 # - - - Registration - - - - - - - - - - - - - - - - - - - -
 
-    @ndb.transactional(xg=True)
     def _conferenceRegistration(self, request, reg=True):
         """Register or unregister user for selected conference."""
-        retval = None
         prof = self._getProfileFromUser() # get user Profile
 
         # check if conf exists given websafeConfKey
@@ -491,6 +866,9 @@ class ConferenceApi(remote.Service):
         if not conf:
             raise endpoints.NotFoundException(
                 'No conference found with key: %s' % wsck)
+        if not conf.seatShards:
+            conf = self._shardSeats(conf.key)
+        shard_keys = self._seatShardKeys(conf)
 
         # register
         if reg:
@@ -499,32 +877,156 @@ class ConferenceApi(remote.Service):
                 raise ConflictException(
                     "You have already registered for this conference")
 
-            # check if seats avail
-            if conf.seatsAvailable <= 0:
-                raise ConflictException(
-                    "There are no seats available.")
-
-            # register user, take away one seat
-            prof.conferenceKeysToAttend.append(wsck)
-            conf.seatsAvailable -= 1
-            retval = True
+            # take a seat from a random shard that has seats left; a shard
+            # can run empty before our transaction, so look again then
+            retval = False
+            while not retval:
+                shard_keys = [shard.key for shard in ndb.get_multi(shard_keys)
+                              if shard and shard.seats > 0]
+                # check if seats avail
+                if not shard_keys:
+                    raise ConflictException(
+                        "There are no seats available.")
+                retval = self._registrationTxn(prof.key, wsck, random.choice(shard_keys), reg)
+            seats = memcache.decr(MEMCACHE_SEATS_KEY % wsck)
 
         # unregister
         else:
-            # check if user already registered
+            # add back one seat to a random shard if user was registered
+            retval = self._registrationTxn(prof.key, wsck, random.choice(shard_keys), reg)
+            if retval:
+                seats = memcache.incr(MEMCACHE_SEATS_KEY % wsck)
+
+        if retval:
+            if seats is None:
+                seats = self._getSeatsAvailable(conf)
+            self._noteSeatsAvailable(wsck, conf.name, seats)
+            addCoalescedTask('/tasks/sync_seats_available', {'websafeConferenceKey': wsck},
+                             'sync-seats-%s' % wsck, SEATS_SYNC_INTERVAL)
+        return BooleanMessage(data=retval)
+
+    @ndb.transactional(xg=True)
+    def _registrationTxn(self, prof_key, wsck, shard_key, reg):
+        """Move one seat between a seat shard and the user's Profile.
+
+        Returns False if there is nothing to move: the shard is empty
+        (registering) or the user is not registered (unregistering).
+        """
+        prof, shard = ndb.get_multi([prof_key, shard_key])
+        if reg:
             if wsck in prof.conferenceKeysToAttend:
+                raise ConflictException(
+                    "You have already registered for this conference")
+            if shard.seats <= 0:
+                return False
+            # register user, take away one seat
+            prof.conferenceKeysToAttend.append(wsck)
+            shard.seats -= 1
+        else:
+            if wsck not in prof.conferenceKeysToAttend:
+                return False
+            # unregister user, add back one seat
+            prof.conferenceKeysToAttend.remove(wsck)
+            shard.seats += 1
+
+        # write things back to the datastore
+        ndb.put_multi([prof, shard])
+        self._cacheProfiles([prof])
+        self._noteStatsChange(wsck, {'seatsSold': 1 if reg else -1})
+        return True
 
-                # unregister user, add back one seat
-                prof.conferenceKeysToAttend.remove(wsck)
-                conf.seatsAvailable += 1
-                retval = True
-            else:
-                retval = False
+    @staticmethod
+    def _seatShardKeys(conf):
+        """Return the keys of conf's seat shards."""
+        return ConferenceApi._seatShardKeysOf(conf.key.urlsafe(), conf.seatShards)
 
-        # write things back to the datastore & return
-        prof.put()
-        conf.put()
-        return BooleanMessage(data=retval)
+    @staticmethod
+    def _seatShardKeysOf(wsck, shards):
+        return [ndb.Key(SeatShard, '%s:%d' % (wsck, i)) for i in range(shards)]
+
+    @staticmethod
+    def _buildSeatShards(conf, seats):
+        """Return conf.seatShards SeatShard entities sharing seats evenly."""
+        share, extra = divmod(seats or 0, conf.seatShards)
+        return [SeatShard(key=key, seats=share + (1 if i < extra else 0))
+                for i, key in enumerate(ConferenceApi._seatShardKeys(conf))]
+
+    @staticmethod
+    def _adjustSeatShards(conf, delta):
+        """Add delta (possibly negative) seats to conf's shards and return the
+        new number of available seats, which never drops below zero. Adds
+        shards as the conference grows; must run in an xg transaction."""
+        shards = ndb.get_multi(ConferenceApi._seatShardKeys(conf))
+        seats = max(0, sum(shard.seats for shard in shards if shard) + delta)
+        conf.seatShards = max(conf.seatShards, min(SEAT_SHARDS, seats))
+        ndb.put_multi(ConferenceApi._buildSeatShards(conf, seats))
+        ndb.get_context().call_on_commit(
+            lambda: memcache.delete(MEMCACHE_SEATS_KEY % conf.key.urlsafe()))
+        return seats
+
+    @staticmethod
+    @ndb.transactional(xg=True)
+    def _shardSeats(conf_key):
+        """Move the seats of a conference created before seat sharding into
+        seat shards; return the updated Conference."""
+        conf = conf_key.get()
+        if not conf.seatShards:
+            conf.seatShards = min(SEAT_SHARDS, max(1, conf.seatsAvailable or 0))
+            ndb.put_multi([conf] + ConferenceApi._buildSeatShards(conf, conf.seatsAvailable))
+        return conf
+
+    @staticmethod
+    def _getSeatsAvailable(conf):
+        """Return the seats available at conf: the cached sum of its shards."""
+        if not conf.seatShards:
+            return conf.seatsAvailable
+        wsck = conf.key.urlsafe()
+        seats = memcache.get(MEMCACHE_SEATS_KEY % wsck)
+        if seats is None:
+            seats = sum(shard.seats for shard in ndb.get_multi(ConferenceApi._seatShardKeys(conf))
+                        if shard)
+            memcache.add(MEMCACHE_SEATS_KEY % wsck, seats, time=SEATS_CACHE_TIME)
+        return seats
+
+    @staticmethod
+    def _getSeatsAvailableMulti(seat_shards):
+        """Return {websafe key: seats available} for {websafe key: number of
+        seat shards}, like _getSeatsAvailable: one memcache batch, and one
+        batch get of the shards of conferences missing from it."""
+        if not seat_shards:
+            return {}
+        seats = memcache.get_multi(seat_shards.keys(), key_prefix=MEMCACHE_SEATS_KEY % '')
+        missing = dict((wsck, ConferenceApi._seatShardKeysOf(wsck, shards))
+                       for wsck, shards in seat_shards.iteritems() if wsck not in seats)
+        if missing:
+            keys = [key for shard_keys in missing.itervalues() for key in shard_keys]
+            shards = dict(zip(keys, ndb.get_multi(keys)))
+            counted = dict((wsck, sum(shards[key].seats for key in shard_keys if shards[key]))
+                           for wsck, shard_keys in missing.iteritems())
+            memcache.add_multi(counted, key_prefix=MEMCACHE_SEATS_KEY % '', time=SEATS_CACHE_TIME)
+            seats.update(counted)
+        return seats
+
+    @staticmethod
+    def _syncSeatsAvailable(conf_key):
+        """Write the sum of a conference's seat shards back to its
+        seatsAvailable property (used by the sync_seats_available task)."""
+        conf = conf_key.get()
+        if not conf or not conf.seatShards:
+            return
+        # read the shards outside the transaction so registrations don't abort it
+        shards = ndb.get_multi(ConferenceApi._seatShardKeys(conf))
+        seats = sum(shard.seats for shard in shards if shard)
+        memcache.set(MEMCACHE_SEATS_KEY % conf_key.urlsafe(), seats, time=SEATS_CACHE_TIME)
+        ConferenceApi._noteSeatsAvailable(conf_key.urlsafe(), conf.name, seats)
+
+        @ndb.transactional()
+        def update():
+            conf = conf_key.get()
+            if conf.seatsAvailable != seats:
+                conf.seatsAvailable = seats
+                conf.put()
+        update()
 
     @endpoints.method(message_types.VoidMessage, ConferenceForms,
             path='conferences/attending',
@@ -533,28 +1035,177 @@ class ConferenceApi(remote.Service):
         """Get list of conferences that user has registered for."""
         prof = self._getProfileFromUser() # get user Profile
         conf_keys = [ndb.Key(urlsafe=wsck) for wsck in prof.conferenceKeysToAttend]
-        conferences = ndb.get_multi(conf_keys)
-
-        # get organizers
-        organisers = [ndb.Key(Profile, conf.organizerUserId) for conf in conferences]
-        profiles = ndb.get_multi(organisers)
-
-        # put display names in a dict for easier fetching
-        names = {}
-        for profile in profiles:
-            names[profile.key.id()] = profile.displayName
-
         # return set of ConferenceForm objects per Conference
-        return ConferenceForms(items=[self._copyConferenceToForm(conf, names[conf.organizerUserId])\
-         for conf in conferences]
-                               )
+        return self._conferenceForms(conf_keys)
 
-    @endpoints.method(CONF_GET_REQUEST, BooleanMessage,
+    @endpoints.method(CONF_GET_REQUEST, RegistrationForm,
             path='conference/{websafeConferenceKey}',
             http_method='POST', name='registerForConference')
     def registerForConference(self, request):
-        """Register user for selected conference."""
-        return self._conferenceRegistration(request)
+        """Register user for selected conference; for ticket drop conferences
+        the registration is queued and reported as PENDING."""
+        conf = ndb.Key(urlsafe=request.websafeConferenceKey).get()
+        if conf and conf.ticketDrop:
+            return self._queueRegistration(conf)
+        self._conferenceRegistration(request)
+        return RegistrationForm(data=True, status=REGISTERED)
+
+    @endpoints.method(CONF_GET_REQUEST, RegistrationForm,
+            path='conference/{websafeConferenceKey}/registration',
+            http_method='GET', name='getRegistrationStatus')
+    def getRegistrationStatus(self, request):
+        """Return the user's registration status for selected conference."""
+        prof = self._getProfileFromUser() # get user Profile
+        wsck = request.websafeConferenceKey
+        if wsck in prof.conferenceKeysToAttend:
+            return RegistrationForm(data=True, status=REGISTERED)
+        reg_request = ndb.Key(RegistrationRequest, '%s:%s' % (wsck, prof.key.id())).get()
+        # a REGISTERED request the user has since unregistered from doesn't count
+        if reg_request and reg_request.status in (PENDING, SOLD_OUT):
+            return RegistrationForm(data=reg_request.status == PENDING, status=reg_request.status)
+        return RegistrationForm(data=False, status=NOT_REGISTERED)
+
+    def _queueRegistration(self, conf):
+        """Queue user's registration for ticket drop conference conf."""
+        prof = self._getProfileFromUser() # get user Profile
+        wsck = conf.key.urlsafe()
+        if wsck in prof.conferenceKeysToAttend:
+            raise ConflictException(
+                "You have already registered for this conference")
+
+        self._storeRegistrationRequest(wsck, prof.key.id())
+        # coalesced, so repeated clicks also make sure a drain is coming
+        addCoalescedTask('/tasks/drain_registrations', {'websafeConferenceKey': wsck},
+                         'drain-registrations-%s' % wsck, REGISTRATION_DRAIN_INTERVAL)
+        return RegistrationForm(data=True, status=PENDING)
+
+    @staticmethod
+    @ndb.transactional()
+    def _storeRegistrationRequest(wsck, user_id):
+        """Store a PENDING request of user_id for wsck and queue it, unless
+        one is pending already; the request and its pull task commit
+        together, so repeated clicks queue once and none is lost."""
+        req_key = ndb.Key(RegistrationRequest, '%s:%s' % (wsck, user_id))
+        reg_request = req_key.get()
+        if not reg_request or reg_request.status != PENDING:
+            RegistrationRequest(key=req_key, conference=wsck, status=PENDING).put()
+            taskqueue.Queue(REGISTRATION_QUEUE).add(
+                taskqueue.Task(payload=user_id, tag=wsck, method='PULL'), transactional=True)
+
+    @staticmethod
+    def _drainRegistrations(wsck):
+        """Settle one batch of queued registrations for a conference.
+
+        Returns True if the queue may hold more registrations for it.
+        """
+        queue = taskqueue.Queue(REGISTRATION_QUEUE)
+        tasks = queue.lease_tasks_by_tag(REGISTRATION_LEASE_TIME, REGISTRATION_BATCH_SIZE, tag=wsck)
+        if not tasks:
+            return False
+        conf = ndb.Key(urlsafe=wsck).get()
+        if not conf:
+            queue.delete_tasks(tasks)
+            return False
+        if not conf.seatShards:
+            conf = ConferenceApi._shardSeats(conf.key)
+
+        # first come, first served; users may appear more than once
+        user_ids = []
+        for task in tasks:
+            if task.payload not in user_ids:
+                user_ids.append(task.payload)
+
+        # each user gets their own transaction, a few at a time
+        shard_keys = [shard.key for shard in ndb.get_multi(ConferenceApi._seatShardKeys(conf))
+                      if shard and shard.seats > 0]
+        seats = 0
+        settled = set()
+        try:
+            for i in range(0, len(user_ids), REGISTRATION_TXN_PARALLELISM):
+                group = user_ids[i:i + REGISTRATION_TXN_PARALLELISM]
+                futures = [ConferenceApi._assignSeatAsync(wsck, user_id, shard_keys)
+                           for user_id in group]
+                ndb.Future.wait_all(futures)
+                for user_id, future in zip(group, futures):
+                    if not future.get_exception():
+                        settled.add(user_id)
+                        seats += 1 if future.get_result() else 0
+                for future in futures:
+                    future.check_success()
+        except Exception:
+            # give the unsettled users back to the queue now, rather than
+            # when their lease expires, so the retried drain finds them
+            queue.delete_tasks([task for task in tasks if task.payload in settled])
+            for task in tasks:
+                if task.payload not in settled:
+                    queue.modify_task_lease(task, 0)
+            if seats:
+                # the sync task also updates the announcement
+                memcache.delete(MEMCACHE_SEATS_KEY % wsck)
+                addCoalescedTask('/tasks/sync_seats_available', {'websafeConferenceKey': wsck},
+                                 'sync-seats-%s' % wsck, SEATS_SYNC_INTERVAL)
+            raise
+        queue.delete_tasks(tasks)
+
+        if seats:
+            memcache.delete(MEMCACHE_SEATS_KEY % wsck)
+            ConferenceApi._noteSeatsAvailable(wsck, conf.name, ConferenceApi._getSeatsAvailable(conf))
+            addCoalescedTask('/tasks/sync_seats_available', {'websafeConferenceKey': wsck},
+                             'sync-seats-%s' % wsck, SEATS_SYNC_INTERVAL)
+        return len(tasks) == REGISTRATION_BATCH_SIZE
+
+    @staticmethod
+    @ndb.tasklet
+    def _assignSeatAsync(wsck, user_id, shard_keys):
+        """Settle the registration request of user_id, taking a seat from a
+        random one of shard_keys (shards found empty are removed from it).
+        Returns True if a seat was taken."""
+        prof_key = ndb.Key(Profile, user_id)
+        req_key = ndb.Key(RegistrationRequest, '%s:%s' % (wsck, user_id))
+        while True:
+            shard_key = random.choice(shard_keys) if shard_keys else None
+            taken = yield ndb.transaction_async(
+                lambda: ConferenceApi._seatTxnAsync(wsck, prof_key, req_key, shard_key), xg=True)
+            if taken is not None:
+                raise ndb.Return(taken)
+            if shard_key in shard_keys:
+                shard_keys.remove(shard_key)
+
+    @staticmethod
+    @ndb.tasklet
+    def _seatTxnAsync(wsck, prof_key, req_key, shard_key):
+        """Move one seat from shard_key (None when sold out) to the user's
+        Profile and mark their request, all in one transaction.
+
+        Requests no longer PENDING are left alone, so a batch leased again
+        after a failure never takes a seat twice. Returns True if a seat was
+        taken, False if the request was settled without one, and None if
+        the shard turned out to be empty.
+        """
+        entities = yield ndb.get_multi_async(
+            [prof_key, req_key] + ([shard_key] if shard_key else []))
+        prof, reg_request, shard = (entities + [None])[:3]
+        if not prof or not reg_request or reg_request.status != PENDING:
+            raise ndb.Return(False)
+        if wsck in prof.conferenceKeysToAttend:
+            reg_request.status = REGISTERED
+            yield reg_request.put_async()
+            raise ndb.Return(False)
+        if not shard_key:
+            reg_request.status = SOLD_OUT
+            yield reg_request.put_async()
+            raise ndb.Return(False)
+        if not shard or shard.seats <= 0:
+            raise ndb.Return(None)
+
+        shard.seats -= 1
+        prof.conferenceKeysToAttend.append(wsck)
+        reg_request.status = REGISTERED
+        reg_request.seatTaken = True
+        yield ndb.put_multi_async([prof, reg_request, shard])
+        ndb.get_context().call_on_commit(lambda: ConferenceApi._uncacheProfiles([prof.key.id()]))
+        ConferenceApi._noteStatsChange(wsck, {'seatsSold': 1})
+        raise ndb.Return(True)
 
     @endpoints.method(CONF_GET_REQUEST, BooleanMessage,
             path='conference/{websafeConferenceKey}',
@@ -567,61 +1218,152 @@ class ConferenceApi(remote.Service):
 # - - - Announcements - - - - - - - - - - - - - - - - - - - -
 
     @staticmethod
-    def _cacheAnnouncement():
-        """Create Announcement & assign to memcache; used by
-        memcache cron job & putAnnouncement().
-        """
-        confs = Conference.query(ndb.AND(
-            Conference.seatsAvailable <= 5,
-            Conference.seatsAvailable > 0)
-        ).fetch(projection=[Conference.name])
+    def _nearlySoldOut():
+        """Return {websafe key: name} of the nearly sold out conferences."""
+        conferences = memcache.get(MEMCACHE_NEARLY_SOLD_OUT_KEY)
+        if conferences is None:
+            announcement = ANNOUNCEMENT_KEY.get()
+            conferences = announcement.conferences if announcement else {}
+            memcache.add(MEMCACHE_NEARLY_SOLD_OUT_KEY, conferences)
+        return conferences
 
-        if confs:
-            # If there are almost sold out conferences,
-            # format announcement and set it in memcache
-            announcement = '%s %s' % (
+    @staticmethod
+    def _noteSeatsAvailable(wsck, name, seats):
+        """Keep the nearly sold out announcement current after the seats of a
+        conference changed. Costs a single memcache read unless the conference
+        joins or leaves the announcement (or is renamed while on it)."""
+        listed = 0 < (seats or 0) <= NEARLY_SOLD_OUT_SEATS
+        conferences = ConferenceApi._nearlySoldOut()
+        if conferences.get(wsck) == (name if listed else None):
+            return
+        ConferenceApi._updateAnnouncement({wsck: name if listed else None})
+
+    @staticmethod
+    @ndb.transactional()
+    def _updateAnnouncement(changes):
+        """Apply {websafe key: name, or None to remove} to the nearly sold
+        out conferences and return the new announcement."""
+        announcement = ANNOUNCEMENT_KEY.get() or Announcement(key=ANNOUNCEMENT_KEY)
+        conferences = dict(announcement.conferences or {})
+        for wsck, name in changes.iteritems():
+            if name:
+                conferences[wsck] = name
+            else:
+                conferences.pop(wsck, None)
+        announcement.conferences = conferences
+        if conferences:
+            # If there are almost sold out conferences, format announcement
+            announcement.message = '%s %s' % (
                 'Last chance to attend! The following conferences '
                 'are nearly sold out:',
-                ', '.join(conf.name for conf in confs))
-            memcache.set(MEMCACHE_ANNOUNCEMENTS_KEY, announcement)
+                ', '.join(sorted(conferences.itervalues())))
         else:
-            # If there are no sold out conferences,
-            # delete the memcache announcements entry
-            announcement = ""
-            memcache.delete(MEMCACHE_ANNOUNCEMENTS_KEY)
+            announcement.message = ""
+        announcement.put()
+        # readers reload both memcache entries from the datastore
+        ndb.get_context().call_on_commit(lambda: memcache.delete_multi(
+            [MEMCACHE_ANNOUNCEMENTS_KEY, MEMCACHE_NEARLY_SOLD_OUT_KEY]))
+        return announcement.message
+
+    @staticmethod
+    def _cacheAnnouncement():
+        """Check the nearly sold out announcement against current seat counts,
+        repair any drift & refresh memcache; used by memcache cron job.
 
-        return announcement
+        Registrations keep the announcement current, so this only looks at
+        conferences on it and those whose seatsAvailable is in range.
+        """
+        announcement = ANNOUNCEMENT_KEY.get()
+        listed = announcement.conferences if announcement and announcement.conferences else {}
+        conf_keys = set(ndb.Key(urlsafe=wsck) for wsck in listed)
+        conf_keys = list(conf_keys.union(Conference.query(ndb.AND(
+            Conference.seatsAvailable <= NEARLY_SOLD_OUT_SEATS,
+            Conference.seatsAvailable > 0)
+        ).fetch(keys_only=True)))
+
+        changes = {}
+        for conf_key, conf in zip(conf_keys, ndb.get_multi(conf_keys)):
+            wsck = conf_key.urlsafe()
+            name = None
+            if conf and 0 < ConferenceApi._getSeatsAvailable(conf) <= NEARLY_SOLD_OUT_SEATS:
+                name = conf.name
+            if listed.get(wsck) != name:
+                changes[wsck] = name
+
+        if changes:
+            return ConferenceApi._updateAnnouncement(changes)
+        message = announcement.message if announcement else ""
+        memcache.set(MEMCACHE_ANNOUNCEMENTS_KEY, message)
+        return message
 
     @endpoints.method(message_types.VoidMessage, StringMessage,
                       path='conference/announcement/get',
                       http_method='GET', name='getAnnouncement')
     def getAnnouncement(self, request):
         """Return Announcement from memcache."""
-        # TODO 1
-        # return an existing announcement from Memcache or an empty string.
+        # return an existing announcement from Memcache, falling back to
+        # its datastore copy, or an empty string.
         announcement = memcache.get(MEMCACHE_ANNOUNCEMENTS_KEY)
-        if not announcement:
-            announcement = ""
-        return StringMessage(data=announcement)
-
-    @staticmethod
-    def _cacheConfBySpeaker(sessions, conference):
-        print "Inside cache conf by speaker method:"
-        sessions = pickle.loads(sessions)
-        conference = pickle.loads(conference)
-        speaker = [session.speaker for session in sessions]
-        speaker = speaker[0]
-        conf = conference.name
-        SESSION_BY_SPEAKER_AND_CONF_KEY = speaker + ' ' + conf
-        if len(sessions) >= 2:
-            featuredSpeaker = '%s %s' % (
-                    'Speaker: ' + speaker + ', ',
-                    'Sessions: ' + ', '.join(session.name for session in sessions))
-            memcache.set(SESSION_BY_SPEAKER_AND_CONF_KEY, featuredSpeaker)
-        else:
-            memcache.delete(SESSION_BY_SPEAKER_AND_CONF_KEY)
-            featuredSpeaker = ""
-        return featuredSpeaker
+        if announcement is None:
+            stored = ANNOUNCEMENT_KEY.get()
+            announcement = stored.message if stored else ""
+            memcache.add(MEMCACHE_ANNOUNCEMENTS_KEY, announcement)
+        return StringMessage(data=announcement or "")
+
+    @staticmethod
+    def _cacheConfBySpeaker(conf_key, speaker):
+        """Update the featured speakers of a conference after sessions by
+        speaker were added; used by the featured speaker task."""
+        sessions = Session.query(Session.speaker == speaker, ancestor=conf_key).fetch(
+            projection=[Session.name])
+        return ConferenceApi._setFeaturedSpeaker(
+            conf_key, speaker, [session.name for session in sessions])
+
+    @staticmethod
+    def _addFeaturedSpeakerTask(conf_key, speaker):
+        """Queue a featured speaker update; session creates for one speaker
+        within FEATURED_SPEAKER_INTERVAL seconds share a single task."""
+        wsck = conf_key.urlsafe()
+        addCoalescedTask('/tasks/add_session_by_speaker_to_cache',
+                         {'websafeConferenceKey': wsck, 'speaker': speaker},
+                         'featured-speaker-%s-%s' % (
+                             wsck, hashlib.md5(speaker.encode('utf-8')).hexdigest()),
+                         FEATURED_SPEAKER_INTERVAL)
+
+    @staticmethod
+    def _buildFeaturedSpeakers(conf_key):
+        """Return {speaker: [session names]} of a conference's speakers with
+        at least FEATURED_SPEAKER_SESSIONS sessions, from the datastore."""
+        speakers = {}
+        for session in Session.query(ancestor=conf_key).fetch(
+                projection=[Session.speaker, Session.name]):
+            speakers.setdefault(session.speaker, []).append(session.name)
+        return dict((speaker, names) for speaker, names in speakers.iteritems()
+                    if len(names) >= FEATURED_SPEAKER_SESSIONS)
+
+    @staticmethod
+    def _setFeaturedSpeaker(conf_key, speaker, session_names):
+        """Record speaker's sessions in the featured speaker aggregate of a
+        conference (one memcache entry per conference); return the aggregate."""
+        key = MEMCACHE_FEATURED_SPEAKERS_KEY % conf_key.urlsafe()
+        client = memcache.Client()
+        for attempt in range(MEMCACHE_CAS_RETRIES):
+            speakers = client.gets(key)
+            if speakers is None:
+                # rebuild it whole; that includes this speaker's sessions
+                speakers = ConferenceApi._buildFeaturedSpeakers(conf_key)
+                if client.add(key, speakers):
+                    return speakers
+                continue
+            if len(session_names) >= FEATURED_SPEAKER_SESSIONS:
+                speakers[speaker] = sorted(session_names)
+            else:
+                speakers.pop(speaker, None)
+            if client.cas(key, speakers):
+                return speakers
+        # too much contention; the next reader rebuilds the aggregate
+        memcache.delete(key)
+        return None
 
     @endpoints.method(FEATURED_SPEAKER_FOR_CONF, StringMessage,
                       path='session/announcement/{webSafeConferenceKey}/get',
@@ -631,77 +1373,289 @@ class ConferenceApi(remote.Service):
         Get Featured Speaker from memcache using conference key.
         """
         conf_key = ndb.Key(urlsafe=request.webSafeConferenceKey)
-        conf_name = conf_key.get().name
-        sessions = Session.query(ancestor=conf_key)
-        SESSION_BY_SPEAKER_AND_CONF_KEY = set()
-        for session in sessions:
-            SESSION_BY_SPEAKER_AND_CONF_KEY.add(session.speaker.title() + ' ' + conf_name)
+        key = MEMCACHE_FEATURED_SPEAKERS_KEY % request.webSafeConferenceKey
+        speakers = memcache.get(key)
+        if speakers is None:
+            speakers = self._buildFeaturedSpeakers(conf_key)
+            memcache.add(key, speakers)
+
         announcements = {}
-        count = 0
-        for key in SESSION_BY_SPEAKER_AND_CONF_KEY:
-            if memcache.get(key) is not None:
-                count += 1
-                announcements[count] = memcache.get(key)
+        for count, speaker in enumerate(sorted(speakers), 1):
+            announcements[count] = '%s %s' % (
+                'Speaker: ' + speaker + ', ',
+                'Sessions: ' + ', '.join(speakers[speaker]))
         if len(announcements) == 0:
             announcements = ""
         else:
             announcements = json.dumps(announcements)
         return StringMessage(data=announcements)
 
+# - - - Conference Stats - - - - - - - - - - - - - - - - - - -
+
+    @staticmethod
+    def _statsKey(conf_key, repair_id=None):
+        """Return the key of a conference's stats, or of the working copy of
+        one of their repairs. Stats are root entities keyed by the websafe
+        conference key, so their transactions don't contend with writes to
+        the organizer's entity group; working copies are their children."""
+        stats_key = ndb.Key(ConferenceStats, conf_key.urlsafe())
+        return ndb.Key(ConferenceStats, repair_id, parent=stats_key) if repair_id else stats_key
+
+    @staticmethod
+    def _sessionStatsDelta(sessions):
+        """Return the stats change of adding sessions (entities or dicts)."""
+        types, speakers = {}, {}
+        for session in sessions:
+            get = session.get if isinstance(session, dict) else \
+                lambda name: getattr(session, name)
+            session_type = get('typeOfSession') or 'NOT_SPECIFIED'
+            types[session_type] = types.get(session_type, 0) + 1
+            speakers[get('speaker')] = speakers.get(get('speaker'), 0) + 1
+        return {'sessionsByType': types, 'speakers': speakers}
+
+    @staticmethod
+    def _mergeStats(total, delta):
+        """Return total (a dict of STATS_FIELDS) with delta added; counts
+        that drop to zero are removed."""
+        merged = dict(total)
+        for field, change in delta.iteritems():
+            if isinstance(change, dict):
+                counts = dict(merged.get(field) or {})
+                for name, count in change.iteritems():
+                    counts[name] = counts.get(name, 0) + count
+                    if not counts[name]:
+                        del counts[name]
+                merged[field] = counts
+            else:
+                merged[field] = (merged.get(field) or 0) + change
+        return merged
+
+    @staticmethod
+    def _noteStatsChange(wsck, delta, name=None):
+        """Queue delta for wsck's ConferenceStats once the current
+        transaction (if any) commits; deltas are applied in batches. A delta
+        given a task name is queued only once."""
+        def queue():
+            try:
+                taskqueue.Queue(STATS_QUEUE).add(taskqueue.Task(
+                    payload=json.dumps(delta), tag=wsck, method='PULL', name=name))
+            except (taskqueue.TaskAlreadyExistsError, taskqueue.TombstonedTaskError):
+                return
+            addCoalescedTask('/tasks/apply_conference_stats', {'websafeConferenceKey': wsck},
+                             'conference-stats-%s' % wsck, STATS_APPLY_INTERVAL)
+        ndb.get_context().call_on_commit(queue)
+
+    @staticmethod
+    def _queueStatsRepair(wsck):
+        """Queue a recount of a conference's stats, at most one per interval."""
+        addCoalescedTask('/tasks/repair_conference_stats', {'websafeConferenceKey': wsck},
+                         'repair-stats-%s' % wsck, STATS_REPAIR_INTERVAL)
+
+    @staticmethod
+    @ndb.transactional()
+    def _addStats(conf_key, delta):
+        """Add delta to a conference's stats, and to the working copy of a
+        running repair so the repair does not lose it. Returns False, and
+        changes nothing, if the conference has no stats yet."""
+        stats = ConferenceApi._statsKey(conf_key).get()
+        if not stats:
+            return False
+        changed = [stats]
+        if stats.repairId:
+            repair = ConferenceApi._statsKey(conf_key, stats.repairId).get()
+            if repair:
+                changed.append(repair)
+        for entity in changed:
+            entity.populate(**ConferenceApi._mergeStats(entity.to_dict(include=STATS_FIELDS), delta))
+        ndb.put_multi(changed)
+        return True
+
+    @staticmethod
+    def _applyStatsDeltas(wsck):
+        """Add one batch of queued deltas to a conference's stats in a single
+        transaction; return True if more may be queued.
+
+        Conferences without stats (created before they were kept) get a
+        repair queued instead; it counts what the dropped deltas described.
+        """
+        queue = taskqueue.Queue(STATS_QUEUE)
+        tasks = queue.lease_tasks_by_tag(STATS_LEASE_TIME, STATS_BATCH_SIZE, tag=wsck)
+        if not tasks:
+            return False
+        delta = {}
+        for task in tasks:
+            delta = ConferenceApi._mergeStats(delta, json.loads(task.payload))
+        try:
+            if not ConferenceApi._addStats(ndb.Key(urlsafe=wsck), delta):
+                ConferenceApi._queueStatsRepair(wsck)
+        except Exception:
+            # give the deltas back now, so the retried task applies them
+            for task in tasks:
+                queue.modify_task_lease(task, 0)
+            raise
+        queue.delete_tasks(tasks)
+        return len(tasks) == STATS_BATCH_SIZE
+
+    @staticmethod
+    @ndb.transactional()
+    def _startRepairStats(conf_key):
+        """Register a new repair of a conference's stats and create its
+        working copy; return the repair id, or None if another repair is
+        running. The stats are created (empty) if they are missing."""
+        stats_key = ConferenceApi._statsKey(conf_key)
+        stats = stats_key.get() or ConferenceStats(key=stats_key)
+        now = datetime.utcnow()
+        if stats.repairId and stats.repairStarted and \
+                (now - stats.repairStarted).total_seconds() < STATS_REPAIR_TIMEOUT:
+            return None
+        stale = [ConferenceApi._statsKey(conf_key, stats.repairId)] if stats.repairId else []
+        stats.repairId = 'repair-%d-%04d' % (time.time() * 1000, random.randint(0, 9999))
+        stats.repairStarted = now
+        ndb.put_multi([stats, ConferenceStats(key=ConferenceApi._statsKey(conf_key, stats.repairId))])
+        # an abandoned repair stops once its working copy is gone
+        ndb.delete_multi(stale)
+        return stats.repairId
+
+    @staticmethod
+    def _repairStats(wsck, repair_id=None, phase=None, cursor=None):
+        """Recount one batch of a conference's stats into the working copy of
+        repair repair_id; return the (repair_id, phase, cursor) to continue
+        with, or None when done (or when another repair is running).
+
+        Phases: sessions (with the number of wishlists holding each), then
+        registrations; then the working copy replaces the stats. Deltas
+        applied meanwhile are added to the working copy too, so none are
+        lost; a change the scan also saw may be counted twice until the
+        next repair.
+        """
+        conf_key = ndb.Key(urlsafe=wsck)
+        if not repair_id:
+            repair_id = ConferenceApi._startRepairStats(conf_key)
+            return (repair_id, 'sessions', None) if repair_id else None
+        if phase == 'done':
+            ConferenceApi._finishRepairStats(conf_key, repair_id)
+            return None
+
+        start = Cursor(urlsafe=cursor) if cursor else None
+        if phase == 'sessions':
+            sessions, next_cursor, more = Session.query(ancestor=conf_key).order(
+                Session.key).fetch_page(STATS_REPAIR_BATCH_SIZE, start_cursor=start)
+            counts = [WishList.query(WishList.sessionKeys == session.key).count_async()
+                      for session in sessions]
+            delta = ConferenceApi._sessionStatsDelta(sessions)
+            delta['wishlists'] = dict((session.key.urlsafe(), count.get_result())
+                                      for session, count in zip(sessions, counts))
+            next_phase = 'sessions' if more else 'registrations'
+        else:
+            keys, next_cursor, more = Profile.query(
+                Profile.conferenceKeysToAttend == wsck).fetch_page(
+                    STATS_REPAIR_BATCH_SIZE * 10, start_cursor=start, keys_only=True)
+            delta = {'seatsSold': len(keys)}
+            next_phase = 'registrations' if more else 'done'
+        if not ConferenceApi._addRepairStats(conf_key, repair_id, delta):
+            return None
+        return repair_id, next_phase, (next_cursor.urlsafe() if more and next_cursor else None)
+
+    @staticmethod
+    @ndb.transactional()
+    def _addRepairStats(conf_key, repair_id, delta):
+        """Add delta to the working copy of repair repair_id; return False
+        if the repair was abandoned."""
+        repair = ConferenceApi._statsKey(conf_key, repair_id).get()
+        if not repair:
+            return False
+        repair.populate(**ConferenceApi._mergeStats(repair.to_dict(include=STATS_FIELDS), delta))
+        repair.put()
+        return True
+
+    @staticmethod
+    @ndb.transactional()
+    def _finishRepairStats(conf_key, repair_id):
+        """Replace the stats with the working copy of repair repair_id."""
+        repair_key = ConferenceApi._statsKey(conf_key, repair_id)
+        stats, repair = ndb.get_multi([ConferenceApi._statsKey(conf_key), repair_key])
+        if stats and repair and stats.repairId == repair_id:
+            stats.populate(repairId=None, repairStarted=None,
+                           **repair.to_dict(include=STATS_FIELDS))
+            stats.put()
+        repair_key.delete()
+
+    @staticmethod
+    def _repairAllStats(cursor=None):
+        """Queue a stats repair for one batch of conferences; return the
+        cursor to continue from, or None when done."""
+        keys, next_cursor, more = Conference.query().fetch_page(
+            STATS_REPAIR_BATCH_SIZE, start_cursor=Cursor(urlsafe=cursor) if cursor else None,
+            keys_only=True)
+        tasks = [taskqueue.Task(url='/tasks/repair_conference_stats',
+                                params={'websafeConferenceKey': key.urlsafe()})
+                 for key in keys]
+        if tasks:
+            taskqueue.Queue().add(tasks)
+        return next_cursor.urlsafe() if more and next_cursor else None
+
+    @endpoints.method(CONF_GET_REQUEST, ConferenceStatsForm,
+                      path='conference/{websafeConferenceKey}/stats',
+                      http_method='GET', name='getConferenceStats')
+    def getConferenceStats(self, request):
+        """Return dashboard statistics of a conference to its organizer."""
+        user = endpoints.get_current_user()
+        if not user:
+            raise endpoints.UnauthorizedException('Authorization required')
+        conf_key = ndb.Key(urlsafe=request.websafeConferenceKey)
+        # a conference is a child of its organizer's Profile
+        if conf_key.parent().id() != getUserId(user):
+            raise endpoints.ForbiddenException(
+                'Only the organizer can see conference statistics.')
+
+        stats = self._statsKey(conf_key).get()
+        if not stats:
+            # created before stats were kept; count them once
+            self._queueStatsRepair(request.websafeConferenceKey)
+            stats = ConferenceStats()
+        by_type = sorted((stats.sessionsByType or {}).items())
+        wishlisted = sorted((stats.wishlists or {}).items(), key=lambda item: -item[1])
+        return ConferenceStatsForm(
+            seatsSold=stats.seatsSold,
+            sessions=sum(count for _, count in by_type),
+            sessionsByType=[StatCountForm(name=name, count=count) for name, count in by_type],
+            speakers=len(stats.speakers or {}),
+            wishlisted=[StatCountForm(name=name, count=count) for name, count in wishlisted])
+
 # - - - - - - - - - Session - - - - - - - - - -
 
     def _copySessionToForm(self, session):
-        se = SessionForm()
-        print session
-        for field in se.all_fields():
-            print field.name
-            print session[field.name] is not None
-            if session[field.name]:
-                if field.name == 'date' or field.name == 'start_time' or field.name == 'duration':
-                    setattr(se, field.name, str(session[field.name]))
-                else:
-                    setattr(se, field.name, session[field.name])
-        se.check_initialized()
-        print se
-        return se
+        """Copy Session property values in a dict (with the session's 'key')
+        to SessionForm."""
+        sf = SESSION_DATA_TO_FORM(session)
+        sf.websafeKey = session['key'].urlsafe()
+        return sf
 
     def _copySessionObjectToForm(self, session):
-        se = SessionForm()
-        for field in se.all_fields():
-            if hasattr(session, field.name):
-                if field.name == 'date':
-                    setattr(se, field.name, str(getattr(session, field.name)))
-                elif field.name == 'start_time':
-                    setattr(se, field.name, str(getattr(session, field.name)))
-                elif field.name == 'duration':
-                    setattr(se, field.name, str(getattr(session, field.name)))
-                else:
-                    setattr(se, field.name, getattr(session, field.name))
-        se.check_initialized()
-        print se
-        return se
+        """Copy relevant fields from Session to SessionForm."""
+        return SESSION_TO_FORM(session)
 
-    @endpoints.method(SESSION_POST_REQUEST, SessionForm,
-                      path='session/{websafeConferenceKey}',
-                      http_method='POST', name='createSession')
-    def createSession(self, request):
-        """
-        Create New Session in Conference.
-        """
+    def _getOrganizedConference(self, websafeConferenceKey):
+        """Return the conference if the current user organizes it."""
         user = endpoints.get_current_user()
         if not user:
             raise endpoints.UnauthorizedException('Authorization required')
+        conf_future = ndb.Key(urlsafe=websafeConferenceKey).get_async()
         user_id = getUserId(user)
-        conf = ndb.Key(urlsafe=request.websafeConferenceKey).get()
+        conf = conf_future.get_result()
         if not conf:
             raise endpoints.NotFoundException(
-                'No conference found with key: %s' % request.websafeConferenceKey)
+                'No conference found with key: %s' % websafeConferenceKey)
 
         conf_user_id = conf.organizerUserId
         if user_id != conf_user_id:
             raise endpoints.ForbiddenException('Only conference organizer is authorized to create session')
+        return conf
 
-        data = {field.name: getattr(request, field.name) for field in request.all_fields()}
+    def _sessionDataFromForm(self, form):
+        """Return Session property values from SessionForm form."""
+        data = {field.name: getattr(form, field.name) for field in SessionForm.all_fields()}
+        del data['websafeKey']
 
         if data['date']:
             try:
@@ -723,25 +1677,107 @@ class ConferenceApi(remote.Service):
 
         if data['speaker']:
             data['speaker'] = data['speaker'].title()
+        return data
 
-        del data['websafeConferenceKey']
-
-        conf_key = ndb.Key(urlsafe=request.websafeConferenceKey)
-        session_id = Session.allocate_ids(size=1, parent=conf_key)[0]
-        session_key = ndb.Key(Session, session_id, parent=conf_key)
-        data['key'] = session_key
-        Session(**data).put()
+    @endpoints.method(SESSION_POST_REQUEST, SessionForm,
+                      path='session/{websafeConferenceKey}',
+                      http_method='POST', name='createSession')
+    def createSession(self, request):
+        """
+        Create New Session in Conference.
+        """
+        conf = self._getOrganizedConference(request.websafeConferenceKey)
+        data = self._sessionDataFromForm(request)
 
-        sessions = Session.query(ancestor=conf_key)
-        sessions = sessions.filter(Session.speaker == data['speaker'].title()).fetch()
-        conf = conf_key.get()
-        taskqueue.add(params={'sessions': pickle.dumps(sessions),
-                              'conference': pickle.dumps(conf)},
-                      url='/tasks/add_session_by_speaker_to_cache'
-                      )
+        # the put assigns the session id; queue the (delayed) featured
+        # speaker task while it runs
+        put_future = Session(parent=conf.key, **data).put_async()
+        self._addFeaturedSpeakerTask(conf.key, data['speaker'])
+        data['key'] = put_future.get_result()
+        self._invalidateConferenceSessions(request.websafeConferenceKey)
+        self._noteStatsChange(request.websafeConferenceKey, self._sessionStatsDelta([data]))
 
         return self._copySessionToForm(data)
 
+    @endpoints.method(SESSIONS_POST_REQUEST, SessionBatchForm,
+                      path='sessions/{websafeConferenceKey}',
+                      http_method='POST', name='createSessions')
+    def createSessions(self, request):
+        """
+        Create many Sessions in Conference (e.g. a whole agenda) at once.
+        Invalid items are reported in errors by index; the others are created.
+        """
+        if len(request.sessions) > MAX_SESSION_BATCH:
+            raise endpoints.BadRequestException(
+                "At most %d sessions can be created at once." % MAX_SESSION_BATCH)
+        conf = self._getOrganizedConference(request.websafeConferenceKey)
+
+        # validate everything before writing anything
+        sessions = []
+        errors = []
+        for index, form in enumerate(request.sessions):
+            try:
+                sessions.append(self._sessionDataFromForm(form))
+            except endpoints.BadRequestException as e:
+                errors.append(SessionErrorForm(index=index, message=str(e)))
+
+        if sessions:
+            first, last = Session.allocate_ids(size=len(sessions), parent=conf.key)
+            for session_id, data in zip(range(first, last + 1), sessions):
+                data['key'] = ndb.Key(Session, session_id, parent=conf.key)
+            ndb.put_multi([Session(**data) for data in sessions])
+            self._invalidateConferenceSessions(request.websafeConferenceKey)
+            # one featured speaker update per speaker, not per session
+            for speaker in set(data['speaker'] for data in sessions):
+                self._addFeaturedSpeakerTask(conf.key, speaker)
+            self._noteStatsChange(request.websafeConferenceKey, self._sessionStatsDelta(sessions))
+
+        return SessionBatchForm(sessions=[self._copySessionToForm(data) for data in sessions],
+                                errors=errors)
+
+    @staticmethod
+    def _conferenceSessionsVersion(wsck):
+        """Return the current version of a conference's session snapshot."""
+        version_key = MEMCACHE_SESSIONS_VERSION_KEY % wsck
+        version = memcache.get(version_key)
+        if version is None:
+            # start from a clock value, as for conference query generations
+            memcache.add(version_key, int(time.time() * 1000000))
+            version = memcache.get(version_key) or 0
+        return version
+
+    @staticmethod
+    def _invalidateConferenceSessions(wsck):
+        """Start a new version of a conference's session snapshot, after the
+        current transaction (if any) commits."""
+        ndb.get_context().call_on_commit(
+            lambda: memcache.incr(MEMCACHE_SESSIONS_VERSION_KEY % wsck))
+
+    def _getConferenceSessionForms(self, wsck):
+        """Return the SessionForms of all sessions of a conference.
+
+        They are served from a snapshot in memcache, keyed by the snapshot
+        version, and rebuilt with one ancestor query when it is missing. A
+        snapshot built while a session is created is stored under the old
+        version and so is never served.
+        """
+        cache_key = MEMCACHE_SESSIONS_KEY % (wsck, self._conferenceSessionsVersion(wsck))
+        cached = memcache.get(cache_key)
+        countCacheLookup(CONFERENCE_SESSIONS_CACHE, cached is not None)
+        if cached is not None:
+            return protojson.decode_message(SessionForms, cached)
+
+        conf_key = ndb.Key(urlsafe=wsck)
+        conf_future = conf_key.get_async()
+        sessions = Session.query(ancestor=conf_key).fetch()
+        if not conf_future.get_result():
+            raise endpoints.NotFoundException(
+                'No conference found with key: %s' % wsck)
+        forms = SessionForms(sessions=[self._copySessionObjectToForm(session)
+                                       for session in sessions])
+        memcache.set(cache_key, protojson.encode_message(forms), time=SESSIONS_CACHE_TIME)
+        return forms
+
     @endpoints.method(CONF_GET_REQUEST, SessionForms,
                       path='session/{websafeConferenceKey}',
                       http_method='GET', name='getConferenceSessions')
@@ -749,15 +1785,7 @@ class ConferenceApi(remote.Service):
         """
         Get Session for Conference using Conference Key.
         """
-        conf = ndb.Key(urlsafe=request.websafeConferenceKey).get()
-        if not conf:
-            raise endpoints.NotFoundException(
-                'No conference found with key: %s' % request.websafeConferenceKey)
-        sessions = Session.query(ancestor=ndb.Key(urlsafe=request.websafeConferenceKey))
-        return SessionForms(sessions=
-                            [self._copySessionObjectToForm(session)
-                             for session in sessions]
-                            )
+        return self._getConferenceSessionForms(request.websafeConferenceKey)
 
     @endpoints.method(SESSION_BY_TYP_REQUEST, SessionForms,
                       path='session/{websafeConferenceKey}/{typeOfSession}',
@@ -766,16 +1794,9 @@ class ConferenceApi(remote.Service):
         """
         Get Sessions for Conference using Conference Key and Type of Sesssion.
         """
-        conf = ndb.Key(urlsafe=request.websafeConferenceKey).get()
-        if not conf:
-            raise endpoints.NotFoundException(
-                'No conference found with key: %s' % request.websafeConferenceKey)
-        query = Session.query(ancestor=ndb.Key(urlsafe=request.websafeConferenceKey))
-        sessions = query.filter(Session.typeOfSession == request.typeOfSession)
-        return SessionForms(sessions=
-                            [self._copySessionObjectToForm(session)
-                             for session in sessions]
-                            )
+        forms = self._getConferenceSessionForms(request.websafeConferenceKey)
+        return SessionForms(sessions=[form for form in forms.sessions
+                                      if form.typeOfSession == request.typeOfSession])
 
     @endpoints.method(SESSION_BY_SPK_REQUEST, SessionForms,
                       path='session/speaker/{speaker}',
@@ -791,45 +1812,196 @@ class ConferenceApi(remote.Service):
                              for session in sessions]
                             )
 
-    @endpoints.method(message_types.VoidMessage, SessionForms,
+    def _getSessionQuery(self, conf_key, filters):
+        """Return a query for conf_key's sessions matching filters, a list of
+        (property name, operator, value). Any equality filters are served by
+        built-in indexes; inequalities are only allowed on startHour, with at
+        most one equality filter on another property, which is what the
+        composite indexes in index.yaml cover. Results are ordered on the
+        inequality property first."""
+        q = Session.query(ancestor=conf_key)
+        inequality_field = None
+        equalities = [field for field, operator, _ in filters if operator == '=']
+        for field, operator, value in filters:
+            if operator != '=':
+                if field != SESSION_RANGE_FIELD:
+                    raise endpoints.BadRequestException(
+                        "Inequality filters are only allowed on START_HOUR.")
+                if len(equalities) > 1 or SESSION_RANGE_FIELD in equalities:
+                    raise endpoints.BadRequestException(
+                        "A START_HOUR range can be combined with one equality filter "
+                        "on another field.")
+                inequality_field = field
+            q = q.filter(ndb.query.FilterNode(field, operator, value))
+        if inequality_field:
+            q = q.order(ndb.GenericProperty(inequality_field))
+        return q.order(Session.key)
+
+    def _formatSessionFilters(self, filters):
+        """Parse, check validity and format user supplied session filters."""
+        formatted_filters = []
+        for f in filters:
+            try:
+                field = SESSION_FIELDS[f.field]
+                operator = OPERATORS[f.operator]
+            except KeyError:
+                raise endpoints.BadRequestException("Filter contains invalid field or operator.")
+            # "!=" would run as two queries; use IS_WORKSHOP or ranges instead
+            if operator == '!=':
+                raise endpoints.BadRequestException("Session filters don't support NE.")
+
+            value = f.value or ''
+            try:
+                if field == 'startHour':
+                    value = int(value)
+                elif field == 'date':
+                    value = datetime.strptime(value[:10], "%Y-%m-%d").date()
+                elif field == 'isWorkshop':
+                    value = {'true': True, 'false': False}[value.lower()]
+                elif field == 'speaker':
+                    value = value.title()
+            except (KeyError, ValueError):
+                raise endpoints.BadRequestException(
+                    "Filter contains invalid value for %s." % f.field)
+            formatted_filters.append((field, operator, value))
+        return formatted_filters
+
+    @endpoints.method(SESSION_QUERY_REQUEST, SessionForms,
+                      path='sessions/{websafeConferenceKey}/query',
+                      http_method='POST', name='querySessions')
+    def querySessions(self, request):
+        """
+        Query Sessions of a Conference by TYPE, SPEAKER, DATE, START_HOUR and
+        IS_WORKSHOP, one page at a time. Queries always run within the conference.
+        """
+        conf_key = ndb.Key(urlsafe=request.websafeConferenceKey)
+        q = self._getSessionQuery(conf_key, self._formatSessionFilters(request.filters))
+        sessions, next_token = self._fetchPage(q, request)
+        return SessionForms(sessions=[self._copySessionObjectToForm(session)
+                                      for session in sessions],
+                            nextPageToken=next_token)
+
+    @staticmethod
+    def _parseDateTime(value, name):
+        """Parse a YYYY-MM-DD[THH:MM] request value."""
+        try:
+            if len(value) <= 10:
+                return datetime.strptime(value, "%Y-%m-%d")
+            return datetime.strptime(value[:16].replace(' ', 'T'), "%Y-%m-%dT%H:%M")
+        except ValueError:
+            raise endpoints.BadRequestException(
+                "%s should be in format YYYY-MM-DDTHH:MM" % name)
+
+    @endpoints.method(SESSION_TIME_RANGE_REQUEST, SessionForms,
+                      path='sessions/{websafeConferenceKey}/range',
+                      http_method='GET', name='getSessionsInTimeRange')
+    def getSessionsInTimeRange(self, request):
+        """
+        Get Sessions of a Conference starting at or after start and before end
+        (YYYY-MM-DDTHH:MM), in start order, one page at a time.
+        """
+        start = self._parseDateTime(request.start, 'start')
+        end = self._parseDateTime(request.end, 'end')
+        q = Session.query(Session.startDateTime >= start, Session.startDateTime < end,
+                          ancestor=ndb.Key(urlsafe=request.websafeConferenceKey))
+        sessions, next_token = self._fetchPage(
+            q.order(Session.startDateTime, Session.key), request)
+        return SessionForms(sessions=[self._copySessionObjectToForm(session)
+                                      for session in sessions],
+                            nextPageToken=next_token)
+
+    @endpoints.method(NON_WORKSHOP_REQUEST, SessionForms,
                       path='session/nonworkshop/beforeseven',
                       http_method='GET', name='getNonWorkshopSesBeforeSeven')
     def getNonWorkshopSesBeforeSeven(self, request):
         """
-        Get Non Workshop Sessions Before 7 PM.
+        Get Non Workshop Sessions Before 7 PM for a Conference.
         """
-        sessions_nw = Session.query()
-        sessions_before7 = Session.query()
-        if not sessions_nw and sessions_before7:
-            raise endpoints.NotFoundException(
-                'No sessions found')
-        sessions_nw = sessions_nw.filter(Session.typeOfSession != "workshop")
-        sessions_nw_keys = sessions_nw.fetch(None, keys_only=True)
-        print(sessions_nw_keys)
-
-        sessions_before7 = sessions_before7.filter(Session.start_time < datetime.strptime("19:00", "%H:%M").time())
-        sessions_before7_keys = sessions_before7.fetch(None, keys_only=True)
-        print(sessions_before7_keys)
-
-        sessions_keys = list(set(sessions_nw_keys) & set(sessions_before7_keys))
-        print(sessions_keys)
-
-        # sessions = list()
-        #
-        # for key in sessions_keys:
-        #     print(key)
-        #     sessions.append(key.get())
-
-        sessions = ndb.get_multi(sessions_keys)
-        print(sessions)
-
+        conf_key = ndb.Key(urlsafe=request.websafeConferenceKey)
+        # startHour >= 0 leaves out sessions without a start time
+        sessions = self._getSessionQuery(conf_key, [('isWorkshop', '=', False),
+                                                    ('startHour', '>=', 0),
+                                                    ('startHour', '<', 19)])
         return SessionForms(sessions=
                             [self._copySessionObjectToForm(session)
                              for session in sessions]
                             )
 
+    @staticmethod
+    def _resaveSessions(cursor=None, batch_size=100):
+        """Re-put one batch of sessions so their computed properties are
+        stored; return the cursor to continue from, or None when done."""
+        sessions, next_cursor, more = Session.query().fetch_page(
+            batch_size, start_cursor=Cursor(urlsafe=cursor) if cursor else None)
+        ndb.put_multi(sessions)
+        return next_cursor.urlsafe() if more and next_cursor else None
+
 # - - - - - - - - - - WishList - - - - - - - -
 
+    @staticmethod
+    def _wishlistKey(user_id):
+        """Return the key of user_id's wishlist."""
+        return ndb.Key(WishList, user_id, parent=ndb.Key(Profile, user_id))
+
+    @staticmethod
+    def _getWishlist(user_id):
+        """Return user_id's wishlist, or None if there isn't one.
+
+        Wishlists used to get allocated ids, so finding one took an ancestor
+        query; a key get that misses checks for such a wishlist with a
+        keys-only query and only then moves it, in a transaction, to the
+        deterministic key. Reads need no transaction of their own.
+        """
+        wl_key = ConferenceApi._wishlistKey(user_id)
+        wl = wl_key.get()
+        if wl:
+            return wl
+        if not WishList.query(ancestor=wl_key.parent()).get(keys_only=True):
+            return None
+        return ConferenceApi._migrateWishlist(user_id)
+
+    @staticmethod
+    @ndb.transactional()
+    def _migrateWishlist(user_id):
+        """Move user_id's legacy wishlists' sessions to the deterministic key
+        (same entity group), delete them, and return the new wishlist."""
+        wl_key = ConferenceApi._wishlistKey(user_id)
+        wl = wl_key.get()
+        if wl:
+            return wl   # migrated by a concurrent request
+        legacy = WishList.query(ancestor=wl_key.parent()).fetch()
+        if not legacy:
+            return None
+        session_keys = []
+        for old in legacy:
+            for websafe_key in old.session_key:
+                key = ndb.Key(urlsafe=websafe_key)
+                if key not in session_keys:
+                    session_keys.append(key)
+        wl = WishList(key=wl_key, user_id=user_id, sessionKeys=session_keys)
+        wl.put()
+        ndb.delete_multi([old.key for old in legacy])
+        return wl
+
+    @ndb.transactional()
+    def _updateWishlist(self, user_id, session_key, add):
+        """Add session_key to (or remove it from) user_id's wishlist."""
+        wl = self._getWishlist(user_id)
+        if not wl:
+            if not add:
+                return None
+            wl = WishList(key=self._wishlistKey(user_id), user_id=user_id)
+        if add == (session_key in wl.sessionKeys):
+            return wl  # nothing to change
+        if add:
+            wl.sessionKeys.append(session_key)
+        else:
+            wl.sessionKeys.remove(session_key)
+        wl.put()
+        self._noteStatsChange(session_key.parent().urlsafe(),
+                              {'wishlists': {session_key.urlsafe(): 1 if add else -1}})
+        return wl
+
     @endpoints.method(WISHLIST_POST_REQUEST, SessionForm,
                       path='wishlist/add/{sessionkey}',
                       http_method='POST', name='addSessionToWishlist')
@@ -854,22 +2026,7 @@ class ConferenceApi(remote.Service):
             raise endpoints.NotFoundException(
                 'session key is incorrect: %s' % request.sessionkey)
 
-        data = {}
-        data['user_id'] = user_id
-
-        wl = WishList.query(ancestor=ndb.Key(Profile, user_id)).get()
-
-        if not wl:
-            p_key = ndb.Key(Profile, user_id)
-            w_id = WishList.allocate_ids(size=1, parent=p_key)[0]
-            w_key = ndb.Key(WishList, w_id, parent=p_key)
-            data['key'] = w_key
-            data['session_key'] = [request.sessionkey]
-            WishList(**data).put()
-        else:
-            wl.session_key.append(request.sessionkey)
-            wl.put()
-
+        self._updateWishlist(user_id, se.key, True)
         return self._copySessionObjectToForm(se)
 
     @endpoints.method(message_types.VoidMessage, SessionForms,
@@ -884,22 +2041,60 @@ class ConferenceApi(remote.Service):
             raise endpoints.UnauthorizedException('Authorization required')
         user_id = getUserId(user)
 
-        wlist = WishList.query(ancestor=ndb.Key(Profile, user_id)).get()
+        wlist = self._getWishlist(user_id)
         if not wlist:
             raise endpoints.NotFoundException(
                 'No wishlist found for user: %s' % user.nickname())
 
-        skeys = wlist.session_key
-        sessions = []
-
-        for key in skeys:
-            sessions.append(ndb.Key(urlsafe=key).get())
-
+        # one batch get; sessions deleted since they were added are skipped
+        sessions = ndb.get_multi(wlist.sessionKeys)
         return SessionForms(sessions=
                             [self._copySessionObjectToForm(session)
-                             for session in sessions]
+                             for session in sessions if session]
                             )
 
+    @staticmethod
+    def _overlappingSessions(sessions):
+        """Return the pairs of sessions whose times overlap, in start order.
+
+        A sweep over the sessions by start time keeps a heap of the ones
+        still running; each session overlaps exactly the running sessions
+        it meets, so the cost is O(n log n) plus the number of pairs.
+        """
+        timed = sorted((s for s in sessions if s and s.startDateTime),
+                       key=lambda s: (s.startDateTime, s.endDateTime))
+        running, pairs = [], []     # running: heap of (end, start order, session)
+        for order, session in enumerate(timed):
+            while running and running[0][0] <= session.startDateTime:
+                heapq.heappop(running)
+            pairs.extend((other, session) for _, _, other in sorted(
+                running, key=lambda r: r[1]))
+            heapq.heappush(running, (session.endDateTime, order, session))
+        return pairs
+
+    @endpoints.method(message_types.VoidMessage, SessionConflictForms,
+                      path='wishlist/conflicts',
+                      http_method='GET', name='getWishlistConflicts')
+    def getWishlistConflicts(self, request):
+        """
+        Get the pairs of Sessions in wishlist for logged in User that overlap.
+        """
+        user = endpoints.get_current_user()
+        if not user:
+            raise endpoints.UnauthorizedException('Authorization required')
+        user_id = getUserId(user)
+
+        wlist = self._getWishlist(user_id)
+        if not wlist:
+            raise endpoints.NotFoundException(
+                'No wishlist found for user: %s' % user.nickname())
+
+        sessions = ndb.get_multi(wlist.sessionKeys)
+        return SessionConflictForms(conflicts=[
+            SessionConflictForm(first=self._copySessionObjectToForm(first),
+                                second=self._copySessionObjectToForm(second))
+            for first, second in self._overlappingSessions(sessions)])
+
     @endpoints.method(WISHLIST_POST_REQUEST, message_types.VoidMessage,
                       path='wishlist/delete/{sessionkey}',
                       http_method='POST', name='deleteSessionInWishlist')
@@ -911,18 +2106,16 @@ class ConferenceApi(remote.Service):
         if not user:
             raise endpoints.UnauthorizedException('Authorization required')
         user_id = getUserId(user)
+        try:
+            session_key = ndb.Key(urlsafe=request.sessionkey)
+        except:
+            raise endpoints.NotFoundException(
+                'Please check session key: %s' % request.sessionkey)
 
-        wlist = WishList.query(ancestor=ndb.Key(Profile, user_id)).get()
-        if not wlist:
+        if not self._updateWishlist(user_id, session_key, False):
             raise endpoints.NotFoundException(
                 'No wishlist found for user: %s' % user.nickname())
 
-        skeys = wlist.session_key
-
-        if request.sessionkey in skeys:
-            wlist.session_key.remove(request.sessionkey)
-            wlist.put()
-
         return message_types.VoidMessage()
 
 
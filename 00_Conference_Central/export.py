@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+
+"""export.py
+
+Bulk export of Conference, Session, Profile (with its registrations) and
+WishList entities as newline-delimited JSON, one object per entity with
+its '_kind' and websafe '_key'.
+
+exportPage() writes cursor-sized batches until a small byte budget is spent
+and returns a token to resume from; webapp2 buffers a response, so exports
+are paged rather than streamed and each page is held in memory.
+startExport() splits each kind into key ranges at __scatter__ sample
+points and fans the ranges out to tasks; each task stores one batch as an
+ExportChunk and chains the next.
+
+"""
+
+import base64
+import datetime
+import json
+import random
+import time
+
+from google.appengine.api import taskqueue
+from google.appengine.datastore.datastore_query import Cursor
+from google.appengine.ext import ndb
+
+from models import ExportChunk
+from models import ExportJob
+
+EXPORT_KINDS = ('Conference', 'Session', 'Profile', 'WishList')
+EXPORT_BATCH_SIZE = 200
+EXPORT_RESPONSE_BYTES = 1024 * 1024         # per (buffered) response page
+EXPORT_SCATTER_OVERSAMPLING = 32
+MAX_EXPORT_SHARDS = 64
+EXPORT_DOWNLOAD_BATCH = 20                  # chunks per fetch
+
+
+def _jsonValue(value):
+    if isinstance(value, ndb.Key):
+        return value.urlsafe()
+    if isinstance(value, (datetime.date, datetime.time)):  # also datetime
+        return value.isoformat()
+    if isinstance(value, list):
+        return [_jsonValue(v) for v in value]
+    return value
+
+
+def entityRecord(entity):
+    """Return the NDJSON line (without newline) of entity."""
+    record = dict((name, _jsonValue(value))
+                  for name, value in entity.to_dict().iteritems())
+    record['_kind'] = entity._get_kind()
+    record['_key'] = entity.key.urlsafe()
+    return json.dumps(record, sort_keys=True)
+
+
+def _fetchBatch(kind, cursor=None, start=None, end=None, size=EXPORT_BATCH_SIZE):
+    """Return one key-ordered batch of kind in [start, end) (websafe keys,
+    None for open) after cursor, and the cursor of the next batch or None."""
+    model = ndb.Model._lookup_model(kind)
+    query = model.query()
+    if start:
+        query = query.filter(model.key >= ndb.Key(urlsafe=start))
+    if end:
+        query = query.filter(model.key < ndb.Key(urlsafe=end))
+    entities, next_cursor, more = query.order(model.key).fetch_page(
+        size, start_cursor=Cursor(urlsafe=cursor) if cursor else None)
+    return entities, (next_cursor.urlsafe() if more and next_cursor else None)
+
+
+def _encodeToken(state):
+    return base64.urlsafe_b64encode(json.dumps(state))
+
+
+def _decodeToken(token):
+    """Return the export state of a resume token; raise ValueError if it is
+    not one."""
+    try:
+        state = json.loads(base64.urlsafe_b64decode(str(token)))
+        kinds = state['kinds']
+    except (TypeError, KeyError, ValueError):
+        raise ValueError('Invalid export token.')
+    if not kinds or not set(kinds) <= set(EXPORT_KINDS):
+        raise ValueError('Invalid export token.')
+    return state
+
+
+def exportPage(write, kinds=EXPORT_KINDS, token=None):
+    """Write one page of NDJSON lines of kinds, or from where token left off,
+    with write.
+
+    Stops after the batch that passes EXPORT_RESPONSE_BYTES and returns the
+    token of the next page, or None when everything was written.
+    """
+    if token:
+        state = _decodeToken(token)
+    else:
+        unknown = set(kinds) - set(EXPORT_KINDS)
+        if unknown:
+            raise ValueError('Unknown kinds: %s' % ', '.join(sorted(unknown)))
+        state = {'kinds': list(kinds), 'cursor': None}
+    written = 0
+    while state['kinds']:
+        entities, state['cursor'] = _fetchBatch(state['kinds'][0], state['cursor'])
+        lines = ''.join(entityRecord(entity) + '\n' for entity in entities)
+        write(lines)
+        written += len(lines)
+        if not state['cursor']:
+            state['kinds'].pop(0)
+        if written >= EXPORT_RESPONSE_BYTES and state['kinds']:
+            return _encodeToken(state)
+    return None
+
+
+def _scatterSplits(kind, shards):
+    """Return up to shards - 1 keys splitting kind into ranges of similar
+    size, from the datastore's __scatter__ sample of the kind's keys."""
+    if shards < 2:
+        return []
+    keys = ndb.Query(kind=kind).order(ndb.GenericProperty('__scatter__')).fetch(
+        shards * EXPORT_SCATTER_OVERSAMPLING, keys_only=True)
+    keys.sort()
+    if len(keys) < shards:
+        return []   # too few entities to be worth splitting
+    step = len(keys) / float(shards)
+    return sorted(set(keys[int(step * i)] for i in range(1, shards)))
+
+
+def _chunkId(job, kind, shard, seq):
+    return '%s:%s:%03d:%06d' % (job, kind, shard, seq)
+
+
+def _shardTask(job, kind, shard, start, end, cursor=None, seq=0):
+    """Return the (named, so chained once) task exporting chunk seq."""
+    return taskqueue.Task(
+        url='/tasks/export_shard',
+        name='export-%s-%s-%d-%d' % (job, kind, shard, seq),
+        params={'job': job, 'kind': kind, 'shard': shard, 'seq': seq,
+                'start': start or '', 'end': end or '', 'cursor': cursor or ''})
+
+
+def startExport(kinds=EXPORT_KINDS, shards=8):
+    """Start a sharded export of kinds; return its job id."""
+    unknown = set(kinds) - set(EXPORT_KINDS)
+    if unknown:
+        raise ValueError('Unknown kinds: %s' % ', '.join(sorted(unknown)))
+    shards = max(1, min(MAX_EXPORT_SHARDS, shards))
+    job = '%s-%04d' % (time.strftime('%Y%m%d%H%M%S'), random.randint(0, 9999))
+    tasks = []
+    for kind in kinds:
+        splits = [key.urlsafe() for key in _scatterSplits(kind, shards)]
+        for shard, (start, end) in enumerate(zip([None] + splits, splits + [None])):
+            tasks.append(_shardTask(job, kind, shard, start, end))
+    ExportJob(id=job, kinds=list(kinds), shards=len(tasks)).put()
+    queue = taskqueue.Queue()
+    for i in range(0, len(tasks), taskqueue.MAX_TASKS_PER_ADD):
+        queue.add(tasks[i:i + taskqueue.MAX_TASKS_PER_ADD])
+    return job
+
+
+def exportShard(job, kind, shard, seq, start=None, end=None, cursor=None):
+    """Store chunk seq of a shard and queue the next one, if any."""
+    entities, next_cursor = _fetchBatch(kind, cursor, start, end)
+    ExportChunk(id=_chunkId(job, kind, shard, seq), job=job, kind=kind,
+                entities=len(entities), last=next_cursor is None,
+                data=''.join(entityRecord(entity) + '\n' for entity in entities)).put()
+    if next_cursor:
+        try:
+            _shardTask(job, kind, shard, start, end, next_cursor, seq + 1).add()
+        except (taskqueue.TaskAlreadyExistsError, taskqueue.TombstonedTaskError):
+            pass    # queued by an earlier try of this task
+
+
+def getExportStatus(job):
+    """Return the progress of export job, or None if there is no such job."""
+    export_job = ExportJob.get_by_id(job)
+    if not export_job:
+        return None
+    chunks = ExportChunk.query(ExportChunk.job == job)
+    finished = chunks.filter(ExportChunk.last == True).count()
+    return {'job': job, 'kinds': export_job.kinds, 'shards': export_job.shards,
+            'finishedShards': finished, 'chunks': chunks.count(),
+            'done': finished == export_job.shards}
+
+
+def downloadExport(write, job, cursor=None):
+    """Write the stored chunks of export job with write, a few at a time.
+
+    Returns the cursor of the next page after EXPORT_RESPONSE_BYTES, or None.
+    """
+    query = ExportChunk.query(ExportChunk.job == job).order(ExportChunk.key)
+    written = 0
+    while True:
+        chunks, next_cursor, more = query.fetch_page(
+            EXPORT_DOWNLOAD_BATCH, start_cursor=Cursor(urlsafe=cursor) if cursor else None)
+        for chunk in chunks:
+            write(chunk.data)
+            written += len(chunk.data)
+        if not (more and next_cursor):
+            return None
+        cursor = next_cursor.urlsafe()
+        if written >= EXPORT_RESPONSE_BYTES:
+            return cursor
@@ -0,0 +1,286 @@
+#!/usr/bin/env python
+
+"""importer.py
+
+Chunked bulk import of conferences or sessions from a CSV file (with a
+header row) or a JSON list of objects.
+
+startImport() stores the rows in ImportChunks of IMPORT_CHUNK_SIZE and
+queues one task per chunk; importChunk() builds a chunk's entities and
+writes them with one put_multi. Imported entities get keys derived from
+the job's source and each row's externalId (or row number), so re-running
+a chunk, or a whole file under the same source, skips rows that already
+exist instead of duplicating them.
+
+Conference columns: externalId, organizerUserId*, name*, description,
+topics (';'-separated in CSV), city, startDate, endDate (YYYY-MM-DD),
+maxAttendees, ticketDrop. Session columns: externalId, and either
+websafeConferenceKey or organizerUserId and conferenceExternalId, then the
+SessionForm fields (name* and speaker* required).
+
+"""
+
+import csv
+import hashlib
+import json
+import random
+import time
+from cStringIO import StringIO
+from datetime import datetime
+
+import endpoints
+from google.appengine.api import taskqueue
+from google.appengine.ext import ndb
+
+from conference import ConferenceApi
+from conference import DEFAULTS
+from conference import SEAT_SHARDS
+from models import Conference
+from models import ConferenceStats
+from models import ImportChunk
+from models import ImportJob
+from models import Profile
+from models import Session
+from models import SessionForm
+
+IMPORT_KINDS = ('Conference', 'Session')
+IMPORT_FORMATS = ('csv', 'json')
+IMPORT_CHUNK_SIZE = 200
+
+
+def parseRows(content, fmt):
+    """Return the rows, [{column: value}], of a CSV or JSON file."""
+    if fmt == 'csv':
+        return [dict((column.strip(), (value or '').strip().decode('utf-8'))
+                     for column, value in row.items() if column)
+                for row in csv.DictReader(StringIO(content))]
+    if fmt == 'json':
+        rows = json.loads(content)
+        if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+            raise ValueError('JSON imports must be a list of objects.')
+        return rows
+    raise ValueError('Format must be one of: %s' % ', '.join(IMPORT_FORMATS))
+
+
+def _chunkId(job, seq):
+    return '%s:%06d' % (job, seq)
+
+
+def _importId(source, row_id):
+    """Return the key id of the entity imported for row_id of source."""
+    return 'import-' + hashlib.sha1(
+        (u'%s:%s' % (source, row_id)).encode('utf-8')).hexdigest()[:20]
+
+
+def _queueChunks(job, seqs, attempt=0):
+    tasks = [taskqueue.Task(url='/tasks/import_chunk',
+                            name='import-%s-%d-%d' % (job, seq, attempt),
+                            params={'job': job, 'seq': seq})
+             for seq in seqs]
+    queue = taskqueue.Queue()
+    for i in range(0, len(tasks), taskqueue.MAX_TASKS_PER_ADD):
+        queue.add(tasks[i:i + taskqueue.MAX_TASKS_PER_ADD])
+
+
+def startImport(content, fmt, kind, source=None):
+    """Split the rows of a CSV or JSON file into chunks and queue a task per
+    chunk; return the job id. Rows are numbered from 1 (after any header)."""
+    if kind not in IMPORT_KINDS:
+        raise ValueError('Kind must be one of: %s' % ', '.join(IMPORT_KINDS))
+    rows = list(enumerate(parseRows(content, fmt), 1))
+    if not rows:
+        raise ValueError('The file has no rows.')
+    job = '%s-%04d' % (time.strftime('%Y%m%d%H%M%S'), random.randint(0, 9999))
+    chunks = [ImportChunk(id=_chunkId(job, seq), job=job, status='PENDING',
+                          rows=rows[start:start + IMPORT_CHUNK_SIZE])
+              for seq, start in enumerate(range(0, len(rows), IMPORT_CHUNK_SIZE))]
+    ndb.put_multi([ImportJob(id=job, kind=kind, source=source or job,
+                             rows=len(rows), chunks=len(chunks))] + chunks)
+    _queueChunks(job, range(len(chunks)))
+    return job
+
+
+def _text(value):
+    if value is None or value == '':
+        return None
+    return unicode(value)
+
+
+def _conferenceEntities(number, row, source):
+    """Return (key, entities, None) to import a conference row."""
+    organizer, name = _text(row.get('organizerUserId')), _text(row.get('name'))
+    if not organizer or not name:
+        raise ValueError("'organizerUserId' and 'name' are required.")
+    conf_key = ndb.Key(Profile, organizer, Conference,
+                       _importId(source, row.get('externalId') or number))
+
+    topics = row.get('topics')
+    if not isinstance(topics, list):
+        topics = [topic.strip() for topic in (topics or '').split(';') if topic.strip()]
+    data = {'name': name, 'description': _text(row.get('description')),
+            'organizerUserId': organizer, 'city': _text(row.get('city')),
+            'topics': topics,
+            'ticketDrop': str(row.get('ticketDrop', '')).lower() in ('1', 'true', 'yes')}
+    try:
+        data['maxAttendees'] = int(row.get('maxAttendees') or 0)
+        for field in ('startDate', 'endDate'):
+            value = _text(row.get(field))
+            data[field] = datetime.strptime(value[:10], "%Y-%m-%d").date() if value else None
+    except ValueError:
+        raise ValueError('maxAttendees must be a number and dates YYYY-MM-DD.')
+    for df in DEFAULTS:
+        if data.get(df) in (None, []):
+            data[df] = DEFAULTS[df]
+    # as in ConferenceApi._createConferenceObject
+    data['month'] = data['startDate'].month if data['startDate'] else 0
+    data['seatsAvailable'] = max(0, data['maxAttendees'])
+    data['seatShards'] = min(SEAT_SHARDS, max(1, data['seatsAvailable']))
+
+    conf = Conference(key=conf_key, **data)
+    return conf_key, ([conf, ConferenceApi._buildSearchIndex(conf),
+                       ConferenceStats(key=ConferenceApi._statsKey(conf_key))] +
+                      ConferenceApi._buildSeatShards(conf, conf.seatsAvailable)), None
+
+
+def _sessionEntities(number, row, source):
+    """Return (key, entities, conference key) to import a session row."""
+    wsck = _text(row.get('websafeConferenceKey'))
+    if wsck:
+        try:
+            conf_key = ndb.Key(urlsafe=wsck)
+        except Exception:
+            raise ValueError('Invalid websafeConferenceKey.')
+    elif row.get('organizerUserId') and row.get('conferenceExternalId'):
+        conf_key = ndb.Key(Profile, _text(row['organizerUserId']), Conference,
+                           _importId(source, row['conferenceExternalId']))
+    else:
+        raise ValueError("'websafeConferenceKey', or 'organizerUserId' and "
+                         "'conferenceExternalId', are required.")
+    form = SessionForm(**dict((field.name, _text(row.get(field.name)))
+                              for field in SessionForm.all_fields()))
+    if not form.name or not form.speaker:
+        raise ValueError("'name' and 'speaker' are required.")
+    try:
+        data = ConferenceApi()._sessionDataFromForm(form)
+    except endpoints.BadRequestException as e:
+        raise ValueError(str(e))
+    key = ndb.Key(Session, _importId(source, row.get('externalId') or number),
+                  parent=conf_key)
+    return key, [Session(key=key, **data)], conf_key
+
+
+def importChunk(job, seq):
+    """Import the rows of a chunk that is not done yet.
+
+    The keys of the rows to import and the counts are stored on the chunk
+    (status WRITING) before any entity is written. A retry then writes only
+    the recorded rows' entities still missing, reports the same counts and
+    queues the side effects of all recorded rows again; those are idempotent.
+    """
+    chunk = ImportChunk.get_by_id(_chunkId(job, seq))
+    if not chunk or chunk.status == 'DONE':
+        return
+    import_job = ImportJob.get_by_id(job)
+    build = _conferenceEntities if import_job.kind == 'Conference' else _sessionEntities
+
+    built, errors = [], []
+    for number, row in chunk.rows:
+        try:
+            built.append((number,) + build(number, row, import_job.source))
+        except ValueError as e:
+            errors.append({'row': number, 'message': unicode(e)})
+
+    if chunk.status != 'WRITING':
+        # one batch get finds rows imported before & sessions' missing conferences
+        keys = [key for _, key, _, _ in built]
+        parents = list(set(parent for _, _, _, parent in built if parent))
+        found = ndb.get_multi(keys + parents)
+        seen = set(key for key, entity in zip(keys, found) if entity)
+        missing = set(key for key, entity in zip(parents, found[len(keys):]) if not entity)
+
+        imported_keys, skipped = [], 0
+        for number, key, _, parent in built:
+            if parent in missing:
+                errors.append({'row': number, 'message': 'Conference not found.'})
+            elif key in seen:
+                skipped += 1
+            else:
+                seen.add(key)
+                imported_keys.append(key)
+        chunk.status = 'WRITING'
+        chunk.importedKeys = imported_keys
+        chunk.imported = len(imported_keys)
+        chunk.skipped = skipped
+        chunk.errors = sorted(errors, key=lambda error: error['row'])
+        chunk.put()
+        retry = False
+    else:
+        retry = True
+
+    recorded = set(chunk.importedKeys)
+    entities, imported = [], []
+    for _, key, row_entities, _ in built:
+        if key in recorded:
+            recorded.discard(key)   # only a key's first row is imported
+            imported.append(row_entities[0])
+            entities.extend(row_entities)
+    if retry:
+        # keep the recorded counts and write only what is missing; a row's
+        # entities (e.g. a conference and its root seat shards) are in
+        # separate groups, so an interrupted put may have written some
+        found = ndb.get_multi([entity.key for entity in entities])
+        entities = [entity for entity, stored in zip(entities, found) if not stored]
+    ndb.put_multi(entities)
+    _importSideEffects(import_job.kind, imported, '%s-%d' % (job, seq))
+
+    chunk.status = 'DONE'
+    chunk.put()
+
+
+def _importSideEffects(kind, imported, name):
+    """Queue the cache, featured speaker and stats updates of entities
+    imported by chunk name; safe to run again for the same chunk."""
+    if kind == 'Conference':
+        if imported:
+            ConferenceApi._invalidateConferenceQueries()
+        return
+    for conf_key, speaker in set((s.key.parent(), s.speaker) for s in imported):
+        ConferenceApi._addFeaturedSpeakerTask(conf_key, speaker)
+    by_conference = {}
+    for session in imported:
+        by_conference.setdefault(session.key.parent(), []).append(session)
+    for conf_key, sessions in by_conference.items():
+        wsck = conf_key.urlsafe()
+        ConferenceApi._invalidateConferenceSessions(wsck)
+        ConferenceApi._noteStatsChange(
+            wsck, ConferenceApi._sessionStatsDelta(sessions),
+            name='import-%s-%s' % (name, hashlib.sha1(wsck).hexdigest()[:12]))
+
+
+def resumeImport(job):
+    """Queue the chunks of job that are not done again; return how many."""
+    seqs = [int(key.id().rsplit(':', 1)[1]) for key in ImportChunk.query(
+        ImportChunk.job == job, ImportChunk.status.IN(['PENDING', 'WRITING'])).fetch(
+            keys_only=True)]
+    if seqs:
+        _queueChunks(job, seqs, attempt=int(time.time()))
+    return len(seqs)
+
+
+def getImportStatus(job):
+    """Return the progress and row errors of import job, or None."""
+    import_job = ImportJob.get_by_id(job)
+    if not import_job:
+        return None
+    chunks = ImportChunk.query(ImportChunk.job == job).fetch(
+        projection=[ImportChunk.status, ImportChunk.imported, ImportChunk.skipped])
+    errors = []
+    for chunk in ImportChunk.query(ImportChunk.job == job, ImportChunk.hasErrors == True):
+        errors.extend(chunk.errors)
+    done = sum(1 for chunk in chunks if chunk.status == 'DONE')
+    return {'job': job, 'kind': import_job.kind, 'source': import_job.source,
+            'rows': import_job.rows, 'chunks': import_job.chunks, 'doneChunks': done,
+            'imported': sum(chunk.imported for chunk in chunks),
+            'skipped': sum(chunk.skipped for chunk in chunks),
+            'errors': sorted(errors, key=lambda error: error['row']),
+            'done': done == import_job.chunks}
@@ -12,22 +12,42 @@ created by wesc on 2014 may 24
 
 __author__ = 'wesc+api@google.com (Wesley Chun)'
 
+import json
+
 import webapp2
 from google.appengine.api import app_identity
 from google.appengine.api import mail
+from google.appengine.api import taskqueue
+from google.appengine.ext import ndb
+from conference import CACHE_NAMES
 from conference import ConferenceApi
+from export import EXPORT_KINDS
+from export import downloadExport
+from export import exportShard
+from export import exportPage
+from export import getExportStatus
+from export import startExport
+from importer import getImportStatus
+from importer import importChunk
+from importer import resumeImport
+from importer import startImport
+from metrics import getMetrics
+from outbox import scheduleOutbox
+from outbox import sendOutbox
+from tracing import getTraces
+from utils import getCacheStats
 
 
 class SetAnnouncementHandler(webapp2.RequestHandler):
     def get(self):
-        """Set Announcement in Memcache."""
-        # TODO 1
+        """Repair drift in the Announcement & refresh it in Memcache."""
         ConferenceApi._cacheAnnouncement()
 
 
 class SendConfirmationEmailHandler(webapp2.RequestHandler):
     def post(self):
-        """Send email confirming Conference creation."""
+        """Send email confirming Conference creation (tasks queued before
+        confirmations went through the outbox)."""
         mail.send_mail(
             'noreply@%s.appspotmail.com' % (
                 app_identity.get_application_id()),     # from
@@ -39,16 +59,211 @@ class SendConfirmationEmailHandler(webapp2.RequestHandler):
         )
 
 
+class SendOutboxHandler(webapp2.RequestHandler):
+    def get(self):
+        """Make sure an outbox run is queued (cron safety net)."""
+        scheduleOutbox()
+
+    def post(self):
+        """Send a rate-limited batch of outbox digests."""
+        if sendOutbox():
+            scheduleOutbox()
+
+
 class SetSessionBySpktoCache(webapp2.RequestHandler):
     def post(self):
-        """Set Announcement in Memcache."""
-        # TODO 1
-        ConferenceApi._cacheConfBySpeaker(sessions=self.request.get('sessions'),
-                                          conference=self.request.get('conference'))
+        """Update the conference's featured speakers in Memcache."""
+        wsck = self.request.get('websafeConferenceKey')
+        if wsck:    # tasks queued before payloads became keys carry none
+            ConferenceApi._cacheConfBySpeaker(ndb.Key(urlsafe=wsck),
+                                              self.request.get('speaker'))
+
+
+class RebuildConferenceIndexHandler(webapp2.RequestHandler):
+    def post(self):
+        """Rebuild the conference search index one batch per task."""
+        cursor = ConferenceApi._rebuildSearchIndex(self.request.get('cursor'))
+        if cursor:
+            taskqueue.add(params={'cursor': cursor},
+                          url='/tasks/rebuild_conference_index')
+
+
+class ResaveSessionsHandler(webapp2.RequestHandler):
+    def post(self):
+        """Store computed Session properties, one batch per task."""
+        cursor = ConferenceApi._resaveSessions(self.request.get('cursor'))
+        if cursor:
+            taskqueue.add(params={'cursor': cursor},
+                          url='/tasks/resave_sessions')
+
+
+class SyncSeatsAvailableHandler(webapp2.RequestHandler):
+    def post(self):
+        """Write a conference's seat shard total back to the Conference."""
+        ConferenceApi._syncSeatsAvailable(
+            ndb.Key(urlsafe=self.request.get('websafeConferenceKey')))
+
+
+class DrainRegistrationsHandler(webapp2.RequestHandler):
+    def post(self):
+        """Assign seats to queued registrations of a ticket drop conference."""
+        wsck = self.request.get('websafeConferenceKey')
+        if ConferenceApi._drainRegistrations(wsck):
+            taskqueue.add(params={'websafeConferenceKey': wsck},
+                          url='/tasks/drain_registrations')
+
+
+class ApplyConferenceStatsHandler(webapp2.RequestHandler):
+    def post(self):
+        """Apply queued statistics changes of a conference."""
+        wsck = self.request.get('websafeConferenceKey')
+        if ConferenceApi._applyStatsDeltas(wsck):
+            taskqueue.add(params={'websafeConferenceKey': wsck},
+                          url='/tasks/apply_conference_stats')
+
+
+class RepairConferenceStatsHandler(webapp2.RequestHandler):
+    def post(self):
+        """Recount the statistics of a conference, one batch per task, or
+        queue a recount of every conference if none is given."""
+        wsck = self.request.get('websafeConferenceKey')
+        if not wsck:
+            cursor = ConferenceApi._repairAllStats(self.request.get('cursor'))
+            if cursor:
+                taskqueue.add(params={'cursor': cursor},
+                              url='/tasks/repair_conference_stats')
+            return
+        step = ConferenceApi._repairStats(wsck, self.request.get('repair'),
+                                          self.request.get('phase'), self.request.get('cursor'))
+        if step:
+            repair_id, phase, cursor = step
+            taskqueue.add(params={'websafeConferenceKey': wsck, 'repair': repair_id,
+                                  'phase': phase, 'cursor': cursor or ''},
+                          url='/tasks/repair_conference_stats')
+
+
+class CacheStatsHandler(webapp2.RequestHandler):
+    def get(self):
+        """Report hit/miss counters of the application caches as JSON."""
+        self.response.headers['Content-Type'] = 'application/json'
+        self.response.write(json.dumps(
+            dict((name, getCacheStats(name)) for name in CACHE_NAMES)))
+
+
+class MetricsHandler(webapp2.RequestHandler):
+    def get(self):
+        """Report per-endpoint call, latency & RPC metrics as JSON."""
+        self.response.headers['Content-Type'] = 'application/json'
+        self.response.write(json.dumps(getMetrics(), sort_keys=True))
+
+
+class TracesHandler(webapp2.RequestHandler):
+    def get(self):
+        """Dump the kept slow request traces as JSON."""
+        self.response.headers['Content-Type'] = 'application/json'
+        self.response.write(json.dumps(getTraces()))
+
+
+class ImportHandler(webapp2.RequestHandler):
+    def get(self):
+        """Report progress and row errors of an import job as JSON."""
+        status = getImportStatus(self.request.get('job'))
+        if not status:
+            self.abort(404)
+        self.response.headers['Content-Type'] = 'application/json'
+        self.response.write(json.dumps(status))
+
+    def post(self):
+        """Start importing the CSV/JSON file (a 'file' upload or the request
+        body) of kind, or queue the unfinished chunks of job again."""
+        job = self.request.get('job')
+        try:
+            if job:
+                result = {'job': job, 'queuedChunks': resumeImport(job)}
+            else:
+                upload = self.request.POST.get('file')
+                content = upload.value if hasattr(upload, 'value') else self.request.body
+                result = {'job': startImport(content, self.request.get('format', 'csv'),
+                                             self.request.get('kind'),
+                                             self.request.get('source') or None)}
+        except ValueError as e:
+            self.abort(400, str(e))
+        self.response.headers['Content-Type'] = 'application/json'
+        self.response.write(json.dumps(result))
+
+
+class ImportChunkHandler(webapp2.RequestHandler):
+    def post(self):
+        """Import one chunk of an import job."""
+        importChunk(self.request.get('job'), int(self.request.get('seq')))
+
+
+class ExportHandler(webapp2.RequestHandler):
+    def get(self):
+        """Return a page of entities as NDJSON (kinds, next page with token),
+        or report on / download (download=1, next page with cursor) an
+        export job."""
+        job = self.request.get('job')
+        try:
+            if job and not self.request.get('download'):
+                status = getExportStatus(job)
+                if not status:
+                    self.abort(404)
+                self.response.headers['Content-Type'] = 'application/json'
+                self.response.write(json.dumps(status))
+                return
+            self.response.headers['Content-Type'] = 'application/x-ndjson'
+            if job:
+                next_token = downloadExport(self.response.write, job,
+                                            self.request.get('cursor') or None)
+            else:
+                kinds = self.request.get('kinds')
+                next_token = exportPage(self.response.write,
+                                          kinds.split(',') if kinds else EXPORT_KINDS,
+                                          self.request.get('token') or None)
+        except ValueError as e:
+            self.abort(400, str(e))
+        if next_token:
+            self.response.headers['X-Export-Next-Token'] = next_token
+
+    def post(self):
+        """Start a sharded export job of kinds over shards tasks."""
+        kinds = self.request.get('kinds')
+        try:
+            job = startExport(kinds.split(',') if kinds else EXPORT_KINDS,
+                              int(self.request.get('shards') or 8))
+        except ValueError as e:
+            self.abort(400, str(e))
+        self.response.headers['Content-Type'] = 'application/json'
+        self.response.write(json.dumps({'job': job}))
+
+
+class ExportShardHandler(webapp2.RequestHandler):
+    def post(self):
+        """Export one chunk of an export job shard."""
+        exportShard(self.request.get('job'), self.request.get('kind'),
+                    int(self.request.get('shard')), int(self.request.get('seq')),
+                    self.request.get('start') or None, self.request.get('end') or None,
+                    self.request.get('cursor') or None)
 
 
 app = webapp2.WSGIApplication([
     ('/crons/set_announcement', SetAnnouncementHandler),
     ('/tasks/send_confirmation_email', SendConfirmationEmailHandler),
-    ('/tasks/add_session_by_speaker_to_cache', SetSessionBySpktoCache)
+    ('/crons/send_outbox', SendOutboxHandler),
+    ('/tasks/send_outbox', SendOutboxHandler),
+    ('/tasks/add_session_by_speaker_to_cache', SetSessionBySpktoCache),
+    ('/tasks/rebuild_conference_index', RebuildConferenceIndexHandler),
+    ('/tasks/resave_sessions', ResaveSessionsHandler),
+    ('/tasks/sync_seats_available', SyncSeatsAvailableHandler),
+    ('/tasks/drain_registrations', DrainRegistrationsHandler),
+    ('/tasks/apply_conference_stats', ApplyConferenceStatsHandler),
+    ('/tasks/repair_conference_stats', RepairConferenceStatsHandler),
+    ('/tasks/export_shard', ExportShardHandler),
+    ('/tasks/import_chunk', ImportChunkHandler),
+    ('/admin/cache_stats', CacheStatsHandler),
+    ('/admin/metrics', MetricsHandler),
+    ('/admin/traces', TracesHandler),
+    ('/admin/export', ExportHandler),
+    ('/admin/import', ImportHandler),
 ], debug=True)
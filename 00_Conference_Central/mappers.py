@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+
+"""mappers.py
+
+Converters from ndb entities (or dicts of their values) to protorpc
+messages. Each converter is built once per (model, message) pair, so
+per-item conversion is a fixed list of attribute copies rather than an
+all_fields()/hasattr walk.
+
+"""
+
+from google.appengine.ext import ndb
+from protorpc import messages
+
+from tracing import traced
+
+
+def _valueConverter(prop, field):
+    """Return a function converting prop values for field, or None if they
+    can be copied as they are."""
+    if isinstance(field, messages.StringField) and \
+            isinstance(prop, ndb.DateTimeProperty):  # also Date/TimeProperty
+        convert = str
+    elif isinstance(field, messages.EnumField):
+        convert = field.type.lookup_by_name
+    else:
+        return None
+    if prop._repeated:
+        return lambda values: [convert(value) for value in values]
+    return convert
+
+
+def _fieldCopies(model_class, message_class):
+    """Return (name, converter) for message fields backed by a property."""
+    copies = []
+    for field in sorted(message_class.all_fields(), key=lambda f: f.number):
+        prop = getattr(model_class, field.name, None)
+        if isinstance(prop, ndb.Property):
+            copies.append((field.name, _valueConverter(prop, field)))
+    return copies
+
+
+def _requiresCheck(message_class):
+    return any(field.required for field in message_class.all_fields())
+
+
+def modelMapper(model_class, message_class, **extras):
+    """Return a function copying a model_class entity to a new message_class.
+
+    Message fields named like a model property are copied (dates and times
+    as strings, string values of EnumFields as the enum); any other field
+    given as a keyword is set to extras[name](entity).
+    """
+    copies = _fieldCopies(model_class, message_class)
+    computed = sorted(extras.items())
+    check = _requiresCheck(message_class)
+
+    @traced('%s conversion' % message_class.__name__, merge=True)
+    def mapper(entity):
+        message = message_class()
+        for name, convert in copies:
+            value = getattr(entity, name)
+            setattr(message, name, convert(value) if convert else value)
+        for name, compute in computed:
+            setattr(message, name, compute(entity))
+        if check:
+            message.check_initialized()
+        return message
+    return mapper
+
+
+def dictMapper(model_class, message_class):
+    """Return a function copying a dict of model_class property values to a
+    new message_class, skipping empty values."""
+    copies = _fieldCopies(model_class, message_class)
+    check = _requiresCheck(message_class)
+
+    @traced('%s conversion' % message_class.__name__, merge=True)
+    def mapper(data):
+        message = message_class()
+        for name, convert in copies:
+            value = data.get(name)
+            if value:
+                setattr(message, name, convert(value) if convert else value)
+        if check:
+            message.check_initialized()
+        return message
+    return mapper
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+
+"""metrics.py
+
+Per-endpoint call counts, latency histograms, API RPC counts and memcache
+hit ratios for a protorpc Service.
+
+instrument() wraps each remote method of a Service class; an apiproxy hook
+attributes the RPCs made while one runs to it. Counts are buffered per
+instance and added to memcache counters at most every
+METRICS_FLUSH_INTERVAL seconds, in a single call.
+
+"""
+
+import functools
+import threading
+import time
+
+from google.appengine.api import apiproxy_stub_map
+from google.appengine.api import memcache
+
+MEMCACHE_METRICS_KEY = "METRICS:%s:%s"
+METRICS_FLUSH_INTERVAL = 10  # seconds
+# upper bounds (ms) of the latency histogram buckets; the last is open
+LATENCY_BUCKETS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+# RPCs counted by name; others are counted as '<service>.other'
+RPC_CALLS = (
+    'datastore_v3.Get', 'datastore_v3.Put', 'datastore_v3.Delete',
+    'datastore_v3.RunQuery', 'datastore_v3.Next', 'datastore_v3.AllocateIds',
+    'datastore_v3.BeginTransaction', 'datastore_v3.Commit',
+    'datastore_v3.Rollback',
+    'memcache.Get', 'memcache.Set', 'memcache.Delete', 'memcache.Increment',
+    'memcache.BatchIncrement',
+    'taskqueue.Add', 'taskqueue.BulkAdd', 'taskqueue.QueryAndOwnTasks',
+    'taskqueue.Delete',
+    'urlfetch.Fetch', 'mail.Send',
+)
+RPC_SERVICES = ('datastore_v3', 'memcache', 'taskqueue', 'urlfetch', 'mail')
+
+# names of the instrumented methods
+_endpoints = []
+# the endpoint running on this thread and its counts so far
+_current = threading.local()
+# counts of this instance not yet added to memcache
+_counts = {}
+_counts_lock = threading.Lock()
+_counts_flushed = [time.time()]
+
+
+def _rpcName(service, call):
+    name = '%s.%s' % (service, call)
+    if name in RPC_CALLS:
+        return name
+    return '%s.other' % (service if service in RPC_SERVICES else 'other')
+
+
+def _countRpc(service, call, request, response):
+    """apiproxy post-call hook: count the RPC for the running endpoint."""
+    counts = getattr(_current, 'counts', None)
+    if counts is None:
+        return
+    name = 'rpc.' + _rpcName(service, call)
+    counts[name] = counts.get(name, 0) + 1
+    if service == 'memcache' and call == 'Get':
+        counts['memcache.keys'] = counts.get('memcache.keys', 0) + request.key_size()
+        counts['memcache.hits'] = counts.get('memcache.hits', 0) + response.item_size()
+
+
+def _installHook():
+    # the hook list is per API proxy, so check on every request
+    apiproxy_stub_map.apiproxy.GetPostCallHooks().Append('metrics', _countRpc)
+
+
+def _latencyBucket(ms):
+    for bound in LATENCY_BUCKETS:
+        if ms <= bound:
+            return 'le%d' % bound
+    return 'inf'
+
+
+def _record(endpoint, counts, ms, failed):
+    """Buffer one call's counts and flush them if the interval has passed."""
+    counts['calls'] = 1
+    counts['latency.' + _latencyBucket(ms)] = 1
+    counts['latency.total_ms'] = int(ms)
+    if failed:
+        counts['errors'] = 1
+    with _counts_lock:
+        for name, count in counts.items():
+            key = MEMCACHE_METRICS_KEY % (endpoint, name)
+            _counts[key] = _counts.get(key, 0) + count
+        if time.time() - _counts_flushed[0] < METRICS_FLUSH_INTERVAL:
+            return
+        flush = dict(_counts)
+        _counts.clear()
+        _counts_flushed[0] = time.time()
+    memcache.offset_multi(flush, initial_value=0)
+
+
+def _instrumented(name, method):
+    @functools.wraps(method)
+    def wrapper(service, request):
+        if getattr(_current, 'counts', None) is not None:
+            return method(service, request)  # called by another endpoint
+        _installHook()
+        _current.counts = counts = {}
+        failed = True
+        start = time.time()
+        try:
+            response = method(service, request)
+            failed = False
+            return response
+        finally:
+            ms = (time.time() - start) * 1000
+            _current.counts = None
+            _record(name, counts, ms, failed)
+    return wrapper
+
+
+def wrapRemoteMethods(service_class, wrap):
+    """Replace each remote method of service_class with wrap(name, method).
+
+    wrap must keep the method's attributes (functools.wraps does), which
+    protorpc and endpoints read to dispatch and describe it.
+    """
+    remote_methods = getattr(service_class, '_ServiceClass__remote_methods', {})
+    for name, method in service_class.all_remote_methods().items():
+        wrapped = wrap(name, method)
+        setattr(service_class, name, wrapped)
+        if name in remote_methods:
+            remote_methods[name] = wrapped
+    return service_class
+
+
+def instrument(service_class):
+    """Class decorator collecting metrics for every remote method."""
+    _endpoints.extend(service_class.all_remote_methods())
+    return wrapRemoteMethods(service_class, _instrumented)
+
+
+def getMetrics():
+    """Return the collected metrics of every instrumented endpoint."""
+    names = ['calls', 'errors', 'latency.total_ms', 'memcache.keys', 'memcache.hits']
+    names += ['latency.le%d' % bound for bound in LATENCY_BUCKETS] + ['latency.inf']
+    names += ['rpc.' + call for call in RPC_CALLS]
+    names += ['rpc.%s.other' % service for service in RPC_SERVICES + ('other',)]
+    counters = memcache.get_multi([MEMCACHE_METRICS_KEY % (endpoint, name)
+                                   for endpoint in _endpoints for name in names])
+    metrics = {}
+    for endpoint in sorted(_endpoints):
+        counts = dict((name, counters.get(MEMCACHE_METRICS_KEY % (endpoint, name), 0))
+                      for name in names)
+        calls = counts['calls']
+        if not calls:
+            continue
+        histogram = [(label, counts['latency.' + label]) for label in
+                     ['le%d' % bound for bound in LATENCY_BUCKETS] + ['inf']]
+        rpcs = dict((name[4:], count) for name, count in counts.items()
+                    if name.startswith('rpc.') and count)
+        metrics[endpoint] = {
+            'calls': calls,
+            'errors': counts['errors'],
+            'meanLatencyMs': float(counts['latency.total_ms']) / calls,
+            'latencyHistogramMs': dict((label, count) for label, count in histogram if count),
+            'rpcs': rpcs,
+            'rpcsPerCall': dict((name, float(count) / calls) for name, count in rpcs.items()),
+            'memcacheHitRatio': (float(counts['memcache.hits']) / counts['memcache.keys']
+                                 if counts['memcache.keys'] else None),
+        }
+    return metrics
@@ -12,6 +12,7 @@ created/forked from conferences.py by wesc on 2014 may 24
 
 __author__ = 'wesc+api@google.com (Wesley Chun)'
 
+import datetime
 import httplib
 import endpoints
 from protorpc import messages
@@ -25,6 +26,7 @@ class ConflictException(endpoints.ServiceException):
 
 class Profile(ndb.Model):
     """Profile -- User profile object"""
+    _use_memcache = False   # cached by ConferenceApi._getProfiles instead
     displayName = ndb.StringProperty()
     mainEmail = ndb.StringProperty()
     teeShirtSize = ndb.StringProperty(default='NOT_SPECIFIED')
@@ -50,6 +52,12 @@ class BooleanMessage(messages.Message):
     data = messages.BooleanField(1)
 
 
+class RegistrationForm(messages.Message):
+    """RegistrationForm -- outbound registration status message"""
+    data = messages.BooleanField(1)     # request accepted
+    status = messages.StringField(2)    # REGISTERED, PENDING, SOLD_OUT or NOT_REGISTERED
+
+
 class Conference(ndb.Model):
     """Conference -- Conference object"""
     name            = ndb.StringProperty(required=True)
@@ -62,6 +70,95 @@ class Conference(ndb.Model):
     endDate         = ndb.DateProperty()
     maxAttendees    = ndb.IntegerProperty()
     seatsAvailable  = ndb.IntegerProperty()
+    seatShards      = ndb.IntegerProperty(default=0) # 0: seats not sharded yet
+    ticketDrop      = ndb.BooleanProperty(default=False) # queue registrations
+
+
+class SeatShard(ndb.Model):
+    """SeatShard -- a slice of the available seats of a Conference"""
+    _use_cache = False      # always read current seats; shards change constantly
+    _use_memcache = False
+    seats = ndb.IntegerProperty(default=0, indexed=False)
+
+
+class RegistrationRequest(ndb.Model):
+    """RegistrationRequest -- queued registration for a ticket drop Conference"""
+    conference = ndb.StringProperty()   # websafe Conference key
+    status     = ndb.StringProperty()   # PENDING, REGISTERED or SOLD_OUT
+    seatTaken  = ndb.BooleanProperty(default=False)  # a seat shard was charged for it
+    created    = ndb.DateTimeProperty(auto_now_add=True)
+
+
+class Announcement(ndb.Model):
+    """Announcement -- nearly sold out conferences, backing the memcache copy"""
+    conferences = ndb.JsonProperty()    # websafe Conference key -> name
+    message     = ndb.TextProperty()
+
+
+class ConferenceStats(ndb.Model):
+    """ConferenceStats -- dashboard counts of a Conference, keyed by its
+    websafe key (a root entity)"""
+    seatsSold      = ndb.IntegerProperty(default=0, indexed=False)
+    sessionsByType = ndb.JsonProperty(default={})   # typeOfSession -> sessions
+    speakers       = ndb.JsonProperty(default={})   # speaker -> sessions
+    wishlists      = ndb.JsonProperty(default={})   # websafe Session key -> wishlists
+    updated        = ndb.DateTimeProperty(auto_now=True, indexed=False)
+    repairId       = ndb.StringProperty(indexed=False)  # running repair, if any
+    repairStarted  = ndb.DateTimeProperty(indexed=False)
+
+
+class ConferenceSearchIndex(ndb.Model):
+    """ConferenceSearchIndex -- search terms of a Conference (its child entity)"""
+    terms   = ndb.StringProperty(repeated=True)  # words and word prefixes
+    weights = ndb.JsonProperty(indexed=False)    # word -> relevance weight
+
+
+class OutboxMail(ndb.Model):
+    """OutboxMail -- a notification waiting for the outbox worker (outbox.py)"""
+    recipient     = ndb.StringProperty(indexed=False)
+    subject       = ndb.StringProperty(indexed=False)
+    digestSubject = ndb.StringProperty(indexed=False)  # '%d' = number of mails
+    body          = ndb.TextProperty()
+    created       = ndb.DateTimeProperty(auto_now_add=True)
+
+
+class ExportJob(ndb.Model):
+    """ExportJob -- a sharded NDJSON export (see export.py), keyed by job id"""
+    kinds   = ndb.StringProperty(repeated=True)
+    shards  = ndb.IntegerProperty()     # shard tasks over all kinds
+    created = ndb.DateTimeProperty(auto_now_add=True)
+
+
+class ExportChunk(ndb.Model):
+    """ExportChunk -- NDJSON of one batch of an export shard, keyed by
+    job:kind:shard:seq so a retried task overwrites its own chunk"""
+    job      = ndb.StringProperty()
+    kind     = ndb.StringProperty(indexed=False)
+    entities = ndb.IntegerProperty(indexed=False)
+    last     = ndb.BooleanProperty()    # final chunk of its shard
+    data     = ndb.BlobProperty(compressed=True)
+
+
+class ImportJob(ndb.Model):
+    """ImportJob -- a chunked bulk import (see importer.py), keyed by job id"""
+    kind    = ndb.StringProperty(indexed=False)     # Conference or Session
+    source  = ndb.StringProperty(indexed=False)     # namespace of externalIds
+    rows    = ndb.IntegerProperty(indexed=False)
+    chunks  = ndb.IntegerProperty(indexed=False)
+    created = ndb.DateTimeProperty(auto_now_add=True)
+
+
+class ImportChunk(ndb.Model):
+    """ImportChunk -- rows of an import job processed by one task, keyed by
+    job:seq"""
+    job      = ndb.StringProperty()
+    rows     = ndb.JsonProperty(compressed=True)    # [[row number, {column: value}]]
+    status   = ndb.StringProperty()                 # PENDING, WRITING or DONE
+    imported = ndb.IntegerProperty(default=0)
+    importedKeys = ndb.KeyProperty(repeated=True, indexed=False)  # rows' keys, set before writing
+    skipped  = ndb.IntegerProperty(default=0)       # already imported
+    errors   = ndb.JsonProperty()                   # [{'row': n, 'message': m}]
+    hasErrors = ndb.ComputedProperty(lambda self: bool(self.errors))
 
 
 class ConferenceForm(messages.Message):
@@ -78,11 +175,29 @@ class ConferenceForm(messages.Message):
     endDate         = messages.StringField(10) #DateTimeField()
     websafeKey      = messages.StringField(11)
     organizerDisplayName = messages.StringField(12)
+    ticketDrop      = messages.BooleanField(13)
+
+
+class StatCountForm(messages.Message):
+    """StatCountForm -- a named count"""
+    name = messages.StringField(1)
+    count = messages.IntegerField(2, variant=messages.Variant.INT32)
+
+
+class ConferenceStatsForm(messages.Message):
+    """ConferenceStatsForm -- outbound conference statistics message"""
+    seatsSold = messages.IntegerField(1, variant=messages.Variant.INT32)
+    sessions = messages.IntegerField(2, variant=messages.Variant.INT32)
+    sessionsByType = messages.MessageField(StatCountForm, 3, repeated=True)
+    speakers = messages.IntegerField(4, variant=messages.Variant.INT32)
+    wishlisted = messages.MessageField(StatCountForm, 5, repeated=True)  # by session key, most first
 
 
 class ConferenceForms(messages.Message):
     """ConferenceForms -- multiple Conference outbound form message"""
     items = messages.MessageField(ConferenceForm, 1, repeated=True)
+    nextPageToken = messages.StringField(2)
+    truncated = messages.BooleanField(3)    # search matched more than it ranks
 
 
 class TeeShirtSize(messages.Enum):
@@ -114,6 +229,8 @@ class ConferenceQueryForm(messages.Message):
 class ConferenceQueryForms(messages.Message):
     """ConferenceQueryForms -- multiple ConferenceQueryForm inbound form message"""
     filters = messages.MessageField(ConferenceQueryForm, 1, repeated=True)
+    pageSize = messages.IntegerField(2, variant=messages.Variant.INT32)
+    pageToken = messages.StringField(3)
 
 
 class StringMessage(messages.Message):
@@ -129,10 +246,49 @@ class SessionForm(messages.Message):
     typeOfSession = messages.StringField(5)
     date = messages.StringField(6)
     start_time = messages.StringField(7)
+    websafeKey = messages.StringField(8)
 
 
 class SessionForms(messages.Message):
     sessions = messages.MessageField(SessionForm, 1, repeated=True)
+    nextPageToken = messages.StringField(2)
+
+
+class SessionErrorForm(messages.Message):
+    """SessionErrorForm -- outbound error of one item of a session batch"""
+    index = messages.IntegerField(1, variant=messages.Variant.INT32)
+    message = messages.StringField(2)
+
+
+class SessionBatchForm(messages.Message):
+    """SessionBatchForm -- outbound result of a session batch"""
+    sessions = messages.MessageField(SessionForm, 1, repeated=True)
+    errors = messages.MessageField(SessionErrorForm, 2, repeated=True)
+
+
+class SessionConflictForm(messages.Message):
+    """SessionConflictForm -- two overlapping sessions"""
+    first = messages.MessageField(SessionForm, 1)
+    second = messages.MessageField(SessionForm, 2)
+
+
+class SessionConflictForms(messages.Message):
+    """SessionConflictForms -- overlapping pairs of sessions"""
+    conflicts = messages.MessageField(SessionConflictForm, 1, repeated=True)
+
+
+class SessionQueryForm(messages.Message):
+    """SessionQueryForm -- Session query inbound form message"""
+    field = messages.StringField(1)
+    operator = messages.StringField(2)
+    value = messages.StringField(3)
+
+
+class SessionQueryForms(messages.Message):
+    """SessionQueryForms -- multiple SessionQueryForm inbound form message"""
+    filters = messages.MessageField(SessionQueryForm, 1, repeated=True)
+    pageSize = messages.IntegerField(2, variant=messages.Variant.INT32)
+    pageToken = messages.StringField(3)
 
 
 class Session(ndb.Model):
@@ -143,8 +299,31 @@ class Session(ndb.Model):
     typeOfSession = ndb.StringProperty()
     date = ndb.DateProperty()
     start_time = ndb.TimeProperty()
+    # precomputed for indexed compound queries (see ConferenceApi.querySessions)
+    isWorkshop = ndb.ComputedProperty(
+        lambda self: (self.typeOfSession or '').lower() == 'workshop')
+    startHour = ndb.ComputedProperty(
+        lambda self: self.start_time.hour if self.start_time else None)
+    # start & end (start plus duration) for time range queries
+    startDateTime = ndb.ComputedProperty(lambda self: self._startDateTime())
+    endDateTime = ndb.ComputedProperty(lambda self: self._endDateTime())
+
+    def _startDateTime(self):
+        if self.date and self.start_time:
+            return datetime.datetime.combine(self.date, self.start_time)
+        return None
+
+    def _endDateTime(self):
+        start = self._startDateTime()
+        if start is None:
+            return None
+        duration = self.duration or datetime.time()
+        return start + datetime.timedelta(hours=duration.hour, minutes=duration.minute)
 
 
 class WishList(ndb.Model):
+    """WishList -- one per user, keyed by user id under the user's Profile"""
     user_id = ndb.StringProperty()
+    sessionKeys = ndb.KeyProperty(kind='Session', repeated=True)
+    # legacy urlsafe keys on wishlists with allocated ids; see _getWishlist
     session_key = ndb.StringProperty(repeated=True)
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+
+"""outbox.py
+
+Mail outbox. Notifications are stored as OutboxMail entities (usually in a
+put_multi the request makes anyway) and sent by a worker that runs at most
+once per OUTBOX_INTERVAL. Each run merges a recipient's pending mails into
+one digest and sends at most MAIL_SEND_RATE digests per minute. Runs go
+through the 'outbox' queue, whose rate in queue.yaml lets at most one run
+(or retry) start per interval, so runs of adjacent intervals and retries
+of failed runs can't exceed the send rate.
+
+"""
+
+import logging
+from collections import OrderedDict
+
+from google.appengine.api import app_identity
+from google.appengine.api import mail
+from google.appengine.ext import ndb
+
+from models import OutboxMail
+from settings import MAIL_SEND_RATE
+from utils import addCoalescedTask
+
+OUTBOX_INTERVAL = 60        # seconds between outbox runs; see queue.yaml
+OUTBOX_QUEUE = 'outbox'     # runs (and retries) at most once per OUTBOX_INTERVAL
+OUTBOX_FETCH_FACTOR = 10    # mails read per digest a run may send
+
+
+def outboxMail(to, subject, digest_subject, body):
+    """Return an (unsaved) outbox mail; digest_subject, formatted with the
+    number of mails, is the subject when several are sent as one digest."""
+    return OutboxMail(recipient=to, subject=subject,
+                      digestSubject=digest_subject, body=body)
+
+
+def scheduleOutbox():
+    """Make sure an outbox run is queued for the next interval."""
+    addCoalescedTask('/tasks/send_outbox', {}, 'send-outbox', OUTBOX_INTERVAL,
+                     queue_name=OUTBOX_QUEUE)
+
+
+def _send(to, subject, body):
+    mail.send_mail('noreply@%s.appspotmail.com' % app_identity.get_application_id(),
+                   to, subject, body)
+
+
+def sendOutbox():
+    """Send one run's worth of digests, oldest mails first, and delete the
+    mails sent; return True if mails are still pending."""
+    per_run = max(1, MAIL_SEND_RATE * OUTBOX_INTERVAL // 60)
+    mails = OutboxMail.query().order(OutboxMail.created).fetch(
+        per_run * OUTBOX_FETCH_FACTOR)
+
+    digests = OrderedDict()
+    for outbox_mail in mails:
+        digests.setdefault((outbox_mail.recipient, outbox_mail.digestSubject),
+                           []).append(outbox_mail)
+
+    done = []
+    try:
+        for (to, digest_subject), group in digests.items()[:per_run]:
+            if len(group) == 1:
+                subject = group[0].subject
+            else:
+                subject = digest_subject % len(group)
+            try:
+                _send(to, subject, '\r\n\r\n'.join(m.body for m in group))
+            except mail.InvalidEmailError:
+                logging.warning('Dropping %d mails to invalid address %r', len(group), to)
+            done.extend(m.key for m in group)
+    finally:
+        # delete what was sent even if a later send failed
+        ndb.delete_multi(done)
+    return len(done) < len(mails) or len(mails) == per_run * OUTBOX_FETCH_FACTOR
@@ -16,3 +16,17 @@ WEB_CLIENT_ID = ''
 ANDROID_CLIENT_ID = 'replace with Android client ID'
 IOS_CLIENT_ID = 'replace with iOS client ID'
 ANDROID_AUDIENCE = WEB_CLIENT_ID
+
+# Google token endpoints used by utils.getUserId(id_type="oauth"); point them
+# at a local stand-in service for testing.
+TOKENINFO_URL = 'https://www.googleapis.com/oauth2/v1/tokeninfo'
+CERTS_URL = 'https://www.googleapis.com/oauth2/v3/certs'
+ID_TOKEN_ISSUERS = ('accounts.google.com', 'https://accounts.google.com')
+
+# fraction of ConferenceApi calls traced (see tracing.py), and the latency
+# above which a traced call is kept for /admin/traces
+TRACE_SAMPLE_RATE = 0.01
+TRACE_SLOW_MS = 1000
+
+# most digests the mail outbox (see outbox.py) sends per minute
+MAIL_SEND_RATE = 30
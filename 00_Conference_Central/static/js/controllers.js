@@ -346,6 +346,11 @@ conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $lo
     $scope.pagination = $scope.pagination || {};
     $scope.pagination.currentPage = 0;
     $scope.pagination.pageSize = 20;
+    /**
+     * Holds the token of the next server-side page, or null if there are no more pages.
+     * @type {string|null}
+     */
+    $scope.pagination.nextPageToken = null;
     /**
      * Returns the number of the pages in the pagination.
      *
@@ -414,6 +419,9 @@ conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $lo
      */
     $scope.queryConferences = function () {
         $scope.submitted = false;
+        $scope.conferences = [];
+        $scope.pagination.currentPage = 0;
+        $scope.pagination.nextPageToken = null;
         if ($scope.selectedTab == 'ALL') {
             $scope.queryConferencesAll();
         } else if ($scope.selectedTab == 'YOU_HAVE_CREATED') {
@@ -423,12 +431,32 @@ conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $lo
         }
     };
 
+    /**
+     * Fetches the next server-side page of the currently selected tab and appends it.
+     */
+    $scope.loadMoreConferences = function () {
+        if (!$scope.pagination.nextPageToken) {
+            return;
+        }
+        if ($scope.selectedTab == 'ALL') {
+            $scope.queryConferencesAll($scope.pagination.nextPageToken);
+        } else if ($scope.selectedTab == 'YOU_HAVE_CREATED') {
+            $scope.getConferencesCreated($scope.pagination.nextPageToken);
+        }
+    };
+
     /**
      * Invokes the conference.queryConferences API.
+     *
+     * @param pageToken the token of the page to fetch, omitted for the first page.
      */
-    $scope.queryConferencesAll = function () {
+    $scope.queryConferencesAll = function (pageToken) {
         var sendFilters = {
-            filters: []
+            filters: [],
+            pageSize: $scope.pagination.pageSize
+        }
+        if (pageToken) {
+            sendFilters.pageToken = pageToken;
         }
         for (var i = 0; i < $scope.filters.length; i++) {
             var filter = $scope.filters[i];
@@ -458,10 +486,10 @@ conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $lo
                         $scope.alertStatus = 'success';
                         $log.info($scope.messages);
 
-                        $scope.conferences = [];
                         angular.forEach(resp.items, function (conference) {
                             $scope.conferences.push(conference);
                         });
+                        $scope.pagination.nextPageToken = resp.nextPageToken || null;
                     }
                     $scope.submitted = true;
                 });
@@ -470,10 +498,16 @@ conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $lo
 
     /**
      * Invokes the conference.getConferencesCreated method.
+     *
+     * @param pageToken the token of the page to fetch, omitted for the first page.
      */
-    $scope.getConferencesCreated = function () {
+    $scope.getConferencesCreated = function (pageToken) {
+        var params = {pageSize: $scope.pagination.pageSize};
+        if (pageToken) {
+            params.pageToken = pageToken;
+        }
         $scope.loading = true;
-        gapi.client.conference.getConferencesCreated().
+        gapi.client.conference.getConferencesCreated(params).
             execute(function (resp) {
                 $scope.$apply(function () {
                     $scope.loading = false;
@@ -495,10 +529,10 @@ conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $lo
                         $scope.alertStatus = 'success';
                         $log.info($scope.messages);
 
-                        $scope.conferences = [];
                         angular.forEach(resp.items, function (conference) {
                             $scope.conferences.push(conference);
                         });
+                        $scope.pagination.nextPageToken = resp.nextPageToken || null;
                     }
                     $scope.submitted = true;
                 });
@@ -624,7 +658,11 @@ conferenceApp.controllers.controller('ConferenceDetailCtrl', function ($scope, $
                         return;
                     }
                 } else {
-                    if (resp.result) {
+                    if (resp.result && resp.result.status == 'PENDING') {
+                        // Ticket drop conference: the registration has been queued.
+                        $scope.messages = 'Your registration is queued; check back shortly for your seat';
+                        $scope.alertStatus = 'info';
+                    } else if (resp.result) {
                         // Register succeeded.
                         $scope.messages = 'Registered for the conference';
                         $scope.alertStatus = 'success';
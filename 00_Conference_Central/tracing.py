@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+
+"""tracing.py
+
+Sampled request tracing. trace() starts a trace for a sample of the calls
+to each remote method of a Service class; traced() functions and the API
+RPCs made while it runs become spans in its tree. Traces slower than
+TRACE_SLOW_MS are kept in a ring buffer of TRACE_BUFFER_SIZE memcache
+slots for getTraces().
+
+"""
+
+import functools
+import random
+import threading
+import time
+
+from google.appengine.api import apiproxy_stub_map
+from google.appengine.api import memcache
+
+from metrics import wrapRemoteMethods
+from settings import TRACE_SAMPLE_RATE
+from settings import TRACE_SLOW_MS
+
+MEMCACHE_TRACE_SLOT_KEY = "TRACE:%d"
+MEMCACHE_TRACE_NEXT_KEY = "TRACE_NEXT"
+TRACE_BUFFER_SIZE = 50
+MAX_SPANS = 1000            # per trace; later spans are only counted
+
+# the trace running on this thread
+_active = threading.local()
+
+
+class _Trace(object):
+    """A trace in progress: its root span and the stack of open spans."""
+
+    def __init__(self, name):
+        self.start = time.time()
+        self.root = {'name': name, 'startMs': 0.0, 'children': []}
+        self.stack = [self.root]
+        self.rpcs = {}      # id(rpc request) -> open RPC span
+        self.spans = 1
+        self.dropped = 0
+
+    def open(self, name, parent=None, merge=False):
+        """Start a span under parent (default: the innermost open span)."""
+        parent = parent or self.stack[-1]
+        children = parent.setdefault('children', [])
+        if merge and children and children[-1]['name'] == name:
+            span = children[-1]
+            span['count'] = span.get('count', 1) + 1
+            span['resumed'] = time.time()
+            return span
+        if self.spans >= MAX_SPANS:
+            self.dropped += 1
+            return None
+        self.spans += 1
+        span = {'name': name, 'startMs': self._ms(time.time())}
+        span['resumed'] = time.time()
+        children.append(span)
+        return span
+
+    def close(self, span, error=None):
+        if span is None:
+            return
+        ms = (time.time() - span.pop('resumed')) * 1000
+        span['ms'] = span.get('ms', 0.0) + ms
+        if error is not None:
+            span['error'] = repr(error)
+
+    def _ms(self, when):
+        return (when - self.start) * 1000
+
+
+def _rpcStarted(service, call, request, response):
+    """apiproxy pre-call hook: open a span for the RPC."""
+    trace = getattr(_active, 'trace', None)
+    if trace is not None:
+        span = trace.open('%s.%s' % (service, call))
+        if span is not None:
+            trace.rpcs[id(request)] = span
+
+
+def _rpcFinished(service, call, request, response, rpc, error):
+    """apiproxy post-call hook: close the RPC's span."""
+    trace = getattr(_active, 'trace', None)
+    if trace is not None:
+        trace.close(trace.rpcs.pop(id(request), None), error)
+
+
+def _installHooks():
+    # the hook lists are per API proxy, so check on every traced request
+    apiproxy_stub_map.apiproxy.GetPreCallHooks().Append('tracing', _rpcStarted)
+    apiproxy_stub_map.apiproxy.GetPostCallHooks().Append('tracing', _rpcFinished)
+
+
+def traced(name, merge=False):
+    """Decorator recording calls of the function as spans named name.
+
+    With merge, consecutive calls under the same parent share one span
+    with a 'count', so per-item work (form conversion) stays one span.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            trace = getattr(_active, 'trace', None)
+            if trace is None:
+                return function(*args, **kwargs)
+            span = trace.open(name, merge=merge)
+            if span is not None:
+                trace.stack.append(span)
+            error = None
+            try:
+                return function(*args, **kwargs)
+            except Exception as e:
+                error = e
+                raise
+            finally:
+                if span is not None:
+                    trace.stack.pop()
+                trace.close(span, error)
+        return wrapper
+    return decorator
+
+
+def _store(trace):
+    """Keep a finished trace in the next ring buffer slot."""
+    result = trace.root
+    result.update(time=trace.start, spans=trace.spans, droppedSpans=trace.dropped)
+    slot = memcache.incr(MEMCACHE_TRACE_NEXT_KEY, initial_value=0)
+    if slot is not None:
+        memcache.set(MEMCACHE_TRACE_SLOT_KEY % (slot % TRACE_BUFFER_SIZE), result)
+
+
+def _traced(name, method):
+    @functools.wraps(method)
+    def wrapper(service, request):
+        if getattr(_active, 'trace', None) is not None or \
+                random.random() >= TRACE_SAMPLE_RATE:
+            return method(service, request)
+        _installHooks()
+        _active.trace = trace = _Trace(name)
+        trace.root['resumed'] = trace.start
+        error = None
+        try:
+            return method(service, request)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            _active.trace = None
+            trace.close(trace.root, error)
+            if trace.root['ms'] >= TRACE_SLOW_MS:
+                _store(trace)
+    return wrapper
+
+
+def trace(service_class):
+    """Class decorator tracing a sample of the calls to each remote method."""
+    return wrapRemoteMethods(service_class, _traced)
+
+
+def getTraces():
+    """Return the kept traces, most recent first."""
+    traces = memcache.get_multi([MEMCACHE_TRACE_SLOT_KEY % slot
+                                 for slot in range(TRACE_BUFFER_SIZE)])
+    return sorted(traces.values(), key=lambda t: t['time'], reverse=True)
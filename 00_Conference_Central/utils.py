@@ -1,11 +1,44 @@
+import base64
+import hashlib
 import json
 import os
+import re
+import threading
 import time
 import uuid
 
+from Crypto.Hash import SHA256
+from Crypto.PublicKey import RSA
+from Crypto.Signature import PKCS1_v1_5
+
+from google.appengine.api import memcache
+from google.appengine.api import taskqueue
 from google.appengine.api import urlfetch
 from models import Profile
+from tracing import traced
+
+import settings
+
+MEMCACHE_TOKEN_KEY = "OAUTH_TOKEN:%s"
+MEMCACHE_CERTS_KEY = "OAUTH_SIGNING_KEYS"
+TOKEN_CACHE_SIZE = 10000
+CERTS_CACHE_TIME = 3600     # seconds, unless the certs response says otherwise
+CLOCK_SKEW = 300            # seconds
+
+# verified tokens of this instance: sha256(token) -> (tokeninfo, expiry time)
+_tokens = {}
+# signing keys of this instance: (kid -> RSA key, expiry time)
+_signing_keys = [{}, 0]
 
+MEMCACHE_CACHE_STATS_KEY = "CACHE_STATS:%s:%s"
+CACHE_STATS_FLUSH_INTERVAL = 10  # seconds
+
+# cache lookup counts of this instance not yet added to memcache
+_cache_counts = {}
+_cache_counts_lock = threading.Lock()
+_cache_counts_flushed = [time.time()]
+
+@traced('getUserId')
 def getUserId(user, id_type="email"):
     if id_type == "email":
         return user.email()
@@ -14,24 +47,16 @@ def getUserId(user, id_type="email"):
         """A workaround implementation for getting userid."""
         auth = os.getenv('HTTP_AUTHORIZATION')
         bearer, token = auth.split()
-        token_type = 'id_token'
-        if 'OAUTH_USER_ID' in os.environ:
-            token_type = 'access_token'
-        url = ('https://www.googleapis.com/oauth2/v1/tokeninfo?%s=%s'
-               % (token_type, token))
-        user = {}
-        wait = 1
-        for i in range(3):
-            resp = urlfetch.fetch(url)
-            if resp.status_code == 200:
-                user = json.loads(resp.content)
-                break
-            elif resp.status_code == 400 and 'invalid_token' in resp.content:
-                url = ('https://www.googleapis.com/oauth2/v1/tokeninfo?%s=%s'
-                       % ('access_token', token))
-            else:
-                time.sleep(wait)
-                wait = wait + i
+        token_hash = hashlib.sha256(token).hexdigest()
+        user = _getCachedToken(token_hash)
+        if user is None:
+            user, expires = {}, 0
+            if 'OAUTH_USER_ID' not in os.environ:
+                user, expires = _verifyIdToken(token)
+            if not user:
+                user, expires = _fetchTokenInfo(token)
+            if user:
+                _cacheToken(token_hash, user, expires)
         return user.get('user_id', '')
 
     if id_type == "custom":
@@ -43,3 +68,158 @@ def getUserId(user, id_type="email"):
             return profile.id()
         else:
             return str(uuid.uuid1().get_hex())
+
+
+def _getCachedToken(token_hash):
+    """Return the cached tokeninfo of a verified token, or None."""
+    cached = _tokens.get(token_hash)
+    if cached is None:
+        cached = memcache.get(MEMCACHE_TOKEN_KEY % token_hash)
+        if cached is not None:
+            _tokens[token_hash] = cached
+    if cached is None or cached[1] <= time.time():
+        return None
+    return cached[0]
+
+
+def _cacheToken(token_hash, user, expires):
+    """Cache the tokeninfo of a verified token until it expires."""
+    if expires <= time.time():
+        return
+    if len(_tokens) >= TOKEN_CACHE_SIZE:
+        now = time.time()
+        for key in [key for key, value in _tokens.items() if value[1] <= now]:
+            del _tokens[key]
+        if len(_tokens) >= TOKEN_CACHE_SIZE:
+            _tokens.clear()
+    _tokens[token_hash] = (user, expires)
+    memcache.set(MEMCACHE_TOKEN_KEY % token_hash, (user, expires),
+                 time=int(expires - time.time()) + 1)
+
+
+def _fetchTokenInfo(token):
+    """Verify token with the tokeninfo service; return (tokeninfo, expiry time)."""
+    token_type = 'id_token'
+    if 'OAUTH_USER_ID' in os.environ:
+        token_type = 'access_token'
+    url = '%s?%s=%s' % (settings.TOKENINFO_URL, token_type, token)
+    user = {}
+    wait = 1
+    for i in range(3):
+        resp = urlfetch.fetch(url)
+        if resp.status_code == 200:
+            user = json.loads(resp.content)
+            break
+        elif resp.status_code == 400 and 'invalid_token' in resp.content:
+            url = '%s?%s=%s' % (settings.TOKENINFO_URL, 'access_token', token)
+        else:
+            time.sleep(wait)
+            wait = wait + i
+    return user, time.time() + int(user.get('expires_in', 0))
+
+
+def _b64decode(segment):
+    """Decode a base64url JWT segment (which lacks its padding)."""
+    return base64.urlsafe_b64decode(str(segment) + '=' * (-len(segment) % 4))
+
+
+def _verifyIdToken(token):
+    """Validate a Google ID token locally against the cached signing keys.
+
+    Returns (tokeninfo, expiry time) with the tokeninfo fields getUserId
+    uses, or ({}, 0) if the token can't be validated locally (it may be an
+    access token, or signed with a key we don't have) so the caller falls
+    back to the tokeninfo service.
+    """
+    try:
+        header, payload, signature = token.split('.')
+        claims = json.loads(_b64decode(payload))
+        key = _getSigningKeys().get(json.loads(_b64decode(header)).get('kid'))
+        if not key or not PKCS1_v1_5.new(key).verify(
+                SHA256.new('%s.%s' % (header, payload)), _b64decode(signature)):
+            return {}, 0
+    except (ValueError, TypeError):
+        return {}, 0
+
+    now = time.time()
+    if (claims.get('iss') not in settings.ID_TOKEN_ISSUERS or
+            claims.get('aud') not in (settings.WEB_CLIENT_ID, settings.ANDROID_AUDIENCE) or
+            not claims.get('iat', now) - CLOCK_SKEW <= now < claims.get('exp', 0) + CLOCK_SKEW):
+        return {}, 0
+    user = {'user_id': claims.get('sub'), 'email': claims.get('email'),
+            'audience': claims.get('aud'), 'issued_to': claims.get('azp')}
+    return user, claims['exp']
+
+
+def _getSigningKeys():
+    """Return {kid: RSA key} of Google's ID token signing keys.
+
+    Keys are cached in instance memory and memcache for as long as the
+    certs response allows.
+    """
+    keys, expires = _signing_keys
+    if expires > time.time():
+        return keys
+    cached = memcache.get(MEMCACHE_CERTS_KEY)
+    if cached is None:
+        try:
+            resp = urlfetch.fetch(settings.CERTS_URL)
+        except urlfetch.Error:
+            return keys
+        if resp.status_code != 200:
+            return keys
+        max_age = re.search(r'max-age=(\d+)', resp.headers.get('Cache-Control', ''))
+        cache_time = int(max_age.group(1)) if max_age else CERTS_CACHE_TIME
+        cached = (json.loads(resp.content)['keys'], time.time() + cache_time)
+        memcache.set(MEMCACHE_CERTS_KEY, cached, time=cache_time)
+    jwks, expires = cached
+    keys = dict((jwk['kid'], RSA.construct((long(_b64decode(jwk['n']).encode('hex'), 16),
+                                            long(_b64decode(jwk['e']).encode('hex'), 16))))
+                for jwk in jwks if jwk.get('kty') == 'RSA')
+    _signing_keys[:] = [keys, expires]
+    return keys
+
+
+def countCacheLookup(cache, hit):
+    """Count a hit or a miss of the named cache.
+
+    Counts are buffered per instance and added to the memcache counters at
+    most every CACHE_STATS_FLUSH_INTERVAL seconds, in a single call.
+    """
+    key = MEMCACHE_CACHE_STATS_KEY % (cache, 'hits' if hit else 'misses')
+    with _cache_counts_lock:
+        _cache_counts[key] = _cache_counts.get(key, 0) + 1
+        if time.time() - _cache_counts_flushed[0] < CACHE_STATS_FLUSH_INTERVAL:
+            return
+        counts = dict(_cache_counts)
+        _cache_counts.clear()
+        _cache_counts_flushed[0] = time.time()
+    memcache.offset_multi(counts, initial_value=0)
+
+
+def getCacheStats(cache):
+    """Return hit/miss counters and hit ratio of the named cache."""
+    counters = memcache.get_multi(['hits', 'misses'],
+                                  key_prefix=MEMCACHE_CACHE_STATS_KEY % (cache, ''))
+    hits, misses = counters.get('hits', 0), counters.get('misses', 0)
+    lookups = hits + misses
+    return {'hits': hits, 'misses': misses,
+            'hitRatio': float(hits) / lookups if lookups else None}
+
+
+def addCoalescedTask(url, params, name, interval, queue_name='default'):
+    """Enqueue a task to run once per name and interval of seconds.
+
+    Requests for the same name within one interval are coalesced into a
+    single task that runs after the interval ends. name may only contain
+    letters, digits, '-' and '_' (websafe keys qualify). Tasks of adjacent
+    intervals can run close together; queues with a rate in queue.yaml
+    space them out.
+    """
+    bucket = int(time.time()) // interval
+    try:
+        taskqueue.add(url=url, params=params, countdown=interval,
+                      name='%s-%d' % (name, bucket), queue_name=queue_name)
+    except (taskqueue.TaskAlreadyExistsError, taskqueue.TombstonedTaskError):
+        pass
+
@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+
+"""bench_api.py -- time ConferenceApi endpoint methods on the local testbed
+as data size grows, recording latency and datastore/memcache RPC counts.
+
+usage: python bench/bench_api.py [--sdk PATH] [--sizes CxSxU,...]
+                                 [--repeat R] [--output FILE]
+                                 [--baseline FILE]
+
+Each size is conferences x sessions per conference x users. Results are
+written as JSON; with --baseline, methods whose median latency or RPC
+total grew beyond --tolerance are listed and the exit status is 1.
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+import harness
+import datagen
+
+
+def cases(data):
+    """Return (name, call) pairs for the methods to time against data."""
+    from conference import ConferenceApi
+    from conference import CONF_BY_CONTXT_REQUEST, CONF_BY_MNTH_REQUEST
+    from conference import CONF_GET_REQUEST, CONF_PAGE_REQUEST, CONF_POST_REQUEST
+    from conference import FEATURED_SPEAKER_FOR_CONF, NON_WORKSHOP_REQUEST
+    from conference import SESSION_BY_SPK_REQUEST, SESSION_BY_TYP_REQUEST
+    from conference import SESSION_POST_REQUEST, SESSION_QUERY_REQUEST
+    from models import ConferenceForm, ConferenceQueryForm, ConferenceQueryForms
+    from models import SessionQueryForm
+    from protorpc import message_types
+    from google.appengine.ext import ndb
+
+    api = ConferenceApi()
+    msg = harness.message
+    void = message_types.VoidMessage()
+    wsck = data.conference_keys[0]
+    user = data.users[0]
+    organizer = ndb.Key(urlsafe=wsck).parent().id()
+
+    def signedIn(email, call):
+        def run():
+            harness.signIn(email)
+            return call()
+        return run
+
+    registration_request = msg(CONF_GET_REQUEST,
+                               websafeConferenceKey=registrationConference(api, data, user))
+
+    def registration():
+        api.registerForConference(registration_request)
+        api.unregisterFromConference(registration_request)
+
+    return [
+        ('queryConferences', lambda: api.queryConferences(ConferenceQueryForms(
+            filters=[ConferenceQueryForm(field='CITY', operator='EQ', value='London')]))),
+        ('getConferenceByConTxt', lambda: api.getConferenceByConTxt(
+            msg(CONF_BY_CONTXT_REQUEST, containsTxt='cloud'))),
+        ('getConferenceByMonth', lambda: api.getConferenceByMonth(
+            msg(CONF_BY_MNTH_REQUEST, month=5))),
+        ('getConference', lambda: api.getConference(
+            msg(CONF_GET_REQUEST, websafeConferenceKey=wsck))),
+        ('createConference', signedIn(organizer, lambda: api.createConference(ConferenceForm(
+            name='Bench conference', city='London', startDate='2016-06-01',
+            endDate='2016-06-02', maxAttendees=100)))),
+        ('updateConference', signedIn(organizer, lambda: api.updateConference(msg(
+            CONF_POST_REQUEST, websafeConferenceKey=wsck, description='Updated')))),
+        ('getConferencesCreated', signedIn(organizer, lambda: api.getConferencesCreated(
+            msg(CONF_PAGE_REQUEST)))),
+        ('getConferencesToAttend', signedIn(user, lambda: api.getConferencesToAttend(void))),
+        ('getProfile', signedIn(user, lambda: api.getProfile(void))),
+        ('registerForConference+unregister', signedIn(user, registration)),
+        ('getAnnouncement', lambda: api.getAnnouncement(void)),
+        ('getFeaturedSpeaker', lambda: api.getFeaturedSpeaker(
+            msg(FEATURED_SPEAKER_FOR_CONF, webSafeConferenceKey=wsck))),
+        ('createSession', signedIn(organizer, lambda: api.createSession(msg(
+            SESSION_POST_REQUEST, websafeConferenceKey=wsck, name='Bench session',
+            speaker=data.speakers[1], typeOfSession='talk', start_time='10:00')))),
+        ('getConferenceSessions', lambda: api.getConferenceSessions(
+            msg(CONF_GET_REQUEST, websafeConferenceKey=wsck))),
+        ('getConferenceSessionsByType', lambda: api.getConferenceSessionsByType(
+            msg(SESSION_BY_TYP_REQUEST, websafeConferenceKey=wsck, typeOfSession='talk'))),
+        ('getSessionsBySpeaker', lambda: api.getSessionsBySpeaker(
+            msg(SESSION_BY_SPK_REQUEST, speaker=data.speakers[0]))),
+        ('querySessions', lambda: api.querySessions(msg(
+            SESSION_QUERY_REQUEST, websafeConferenceKey=wsck,
+            filters=[SessionQueryForm(field='START_HOUR', operator='LT', value='12')]))),
+        ('getNonWorkshopSesBeforeSeven', lambda: api.getNonWorkshopSesBeforeSeven(
+            msg(NON_WORKSHOP_REQUEST, websafeConferenceKey=wsck))),
+        ('getSessionsInWishlist', signedIn(user, lambda: api.getSessionsInWishlist(void))),
+    ]
+
+
+def registrationConference(api, data, email):
+    """Return a conference with seats left that the user with email is not
+    registered for (datagen's registrations depend on size and seed),
+    unregistering them from one if there is no such conference."""
+    from conference import CONF_GET_REQUEST
+    from google.appengine.ext import ndb
+
+    harness.signIn(email)
+    attending = api._getProfileFromUser().conferenceKeysToAttend
+    confs = ndb.get_multi([ndb.Key(urlsafe=wsck) for wsck in reversed(data.conference_keys)])
+    for conf in confs:
+        if conf.key.urlsafe() not in attending and api._getSeatsAvailable(conf) > 0:
+            return conf.key.urlsafe()
+    wsck = next(wsck for wsck in reversed(data.conference_keys) if wsck in attending)
+    api.unregisterFromConference(harness.message(CONF_GET_REQUEST, websafeConferenceKey=wsck))
+    return wsck
+
+
+def runSize(size, repeat, seed):
+    """Generate data for size and measure every case; return the results."""
+    conferences, sessions, users = size
+    results = {}
+    with harness.Testbed():
+        from conference import ConferenceApi
+        counter = harness.RpcCounter()
+        start = time.time()
+        data = datagen.generate(ConferenceApi(), conferences, sessions, users, seed=seed)
+        results['_generate_s'] = round(time.time() - start, 3)
+        for name, call in cases(data):
+            results[name] = harness.measure(call, repeat, counter)
+            print '  %-34s %9.2f ms %5d rpcs' % (
+                name, results[name]['median_ms'], results[name]['rpc_total'])
+    return results
+
+
+def regressions(current, baseline, tolerance):
+    """Return descriptions of measurements in current worse than baseline."""
+    found = []
+    for size, methods in sorted(current.items()):
+        for name, result in sorted(methods.items()):
+            before = baseline.get(size, {}).get(name)
+            if name.startswith('_') or not before:
+                continue
+            if result['rpc_total'] > before['rpc_total']:
+                found.append('%s %s: %d -> %d rpcs' % (
+                    size, name, before['rpc_total'], result['rpc_total']))
+            if result['median_ms'] > before['median_ms'] * (1 + tolerance):
+                found.append('%s %s: %.2f -> %.2f ms' % (
+                    size, name, before['median_ms'], result['median_ms']))
+    return found
+
+
+def parseSizes(value):
+    return [tuple(int(n) for n in size.split('x')) for size in value.split(',')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sdk', default=os.environ.get(
+        'APPENGINE_SDK', '/usr/local/google_appengine'))
+    parser.add_argument('--sizes', type=parseSizes, default=parseSizes('10x10x20,50x20x100'))
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed median latency growth vs baseline')
+    args = parser.parse_args()
+    harness.setupPath(args.sdk)
+
+    results = {}
+    for size in args.sizes:
+        label = 'x'.join(str(n) for n in size)
+        print '%s (conferences x sessions x users)' % label
+        results[label] = runSize(size, args.repeat, args.seed)
+
+    with open(args.output, 'w') as f:
+        json.dump({'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                   'python': platform.python_version(),
+                   'repeat': args.repeat,
+                   'seed': args.seed,
+                   'results': results}, f, indent=2, sort_keys=True)
+    print 'wrote %s' % args.output
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(results, json.load(f)['results'], args.tolerance)
+        for line in found:
+            print 'REGRESSION %s' % line
+        if found:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
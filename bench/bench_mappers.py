@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+
+"""bench_mappers.py -- per-item cost of entity to message conversion,
+reflective _copy*ToForm loops vs the precompiled mappers in mappers.py.
+
+usage: python bench/bench_mappers.py [--sdk PATH] [--items N] [--repeat R]
+"""
+
+import argparse
+import os
+import timeit
+from datetime import date, time
+
+from harness import setupPath
+
+
+def reflectiveConference(conf, form_class):
+    """The conversion _copyConferenceToForm did before mappers.py."""
+    cf = form_class()
+    for field in cf.all_fields():
+        if hasattr(conf, field.name):
+            if field.name.endswith('Date'):
+                setattr(cf, field.name, str(getattr(conf, field.name)))
+            else:
+                setattr(cf, field.name, getattr(conf, field.name))
+        elif field.name == "websafeKey":
+            setattr(cf, field.name, conf.key.urlsafe())
+    cf.check_initialized()
+    return cf
+
+
+def reflectiveSession(session, form_class):
+    """The conversion _copySessionObjectToForm did before mappers.py."""
+    se = form_class()
+    for field in se.all_fields():
+        if hasattr(session, field.name):
+            if field.name in ('date', 'start_time', 'duration'):
+                setattr(se, field.name, str(getattr(session, field.name)))
+            else:
+                setattr(se, field.name, getattr(session, field.name))
+    se.check_initialized()
+    return se
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sdk', default=os.environ.get(
+        'APPENGINE_SDK', '/usr/local/google_appengine'))
+    parser.add_argument('--items', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    setupPath(args.sdk)
+
+    from google.appengine.ext import ndb
+    from models import Conference, ConferenceForm, Session, SessionForm
+    from conference import CONFERENCE_TO_FORM, SESSION_TO_FORM
+
+    confs = [Conference(key=ndb.Key('Profile', 'u', Conference, i + 1),
+                        name='Conference %d' % i, description='x' * 200,
+                        organizerUserId='u', topics=['Web', 'Python'],
+                        city='London', startDate=date(2016, 5, 1),
+                        endDate=date(2016, 5, 3), month=5, maxAttendees=100,
+                        seatsAvailable=50)
+             for i in range(args.items)]
+    sessions = [Session(name='Session %d' % i, highlights='y' * 100,
+                        speaker='Speaker %d' % (i % 20),
+                        duration=time(1, 30), typeOfSession='talk',
+                        date=date(2016, 5, 2), start_time=time(9 + i % 8))
+                for i in range(args.items)]
+
+    cases = [
+        ('conference reflective', lambda: [reflectiveConference(c, ConferenceForm) for c in confs]),
+        ('conference mapper', lambda: [CONFERENCE_TO_FORM(c) for c in confs]),
+        ('session reflective', lambda: [reflectiveSession(s, SessionForm) for s in sessions]),
+        ('session mapper', lambda: [SESSION_TO_FORM(s) for s in sessions]),
+    ]
+    for name, run in cases:
+        best = min(timeit.repeat(run, number=1, repeat=args.repeat))
+        print '%-24s %8.2f us/item' % (name, best * 1e6 / args.items)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+
+"""check_outbox.py -- run the mail outbox against the testbed mail stub and
+check digests, the per-run send cap, invalid addresses and cleanup.
+
+usage: python bench/check_outbox.py [--sdk PATH] [--conferences N]
+
+Exits with status 1, listing the failed checks, if the outbox misbehaves.
+"""
+
+import argparse
+import os
+import sys
+
+import harness
+
+ORGANIZER = 'organizer@gmail.com'
+
+
+def run(conferences):
+    """Create conferences for one organizer plus mails to more recipients
+    than one run may send, drain the outbox and return failed checks."""
+    from google.appengine.ext import ndb
+    from google.appengine.ext import testbed
+    from conference import ConferenceApi
+    from models import ConferenceForm
+    from models import OutboxMail
+    from outbox import OUTBOX_INTERVAL
+    from outbox import outboxMail
+    from outbox import sendOutbox
+    from settings import MAIL_SEND_RATE
+
+    failed = []
+
+    def check(ok, description):
+        print '  %-4s %s' % ('ok' if ok else 'FAIL', description)
+        if not ok:
+            failed.append(description)
+
+    with harness.Testbed() as bed:
+        mail_stub = bed.testbed.get_stub(testbed.MAIL_SERVICE_NAME)
+        per_run = max(1, MAIL_SEND_RATE * OUTBOX_INTERVAL // 60)
+
+        harness.signIn(ORGANIZER)
+        api = ConferenceApi()
+        for i in range(conferences):
+            api.createConference(ConferenceForm(name='Outbox conference %d' % i,
+                                                city='London', maxAttendees=10))
+        # one invalid address, and more recipients than one run may mail
+        users = ['user%d@gmail.com' % i for i in range(per_run + 5)]
+        ndb.put_multi([outboxMail('', 'Invalid', 'Invalid %d', 'Dropped')] +
+                      [outboxMail(to, 'Hello', '%d hellos', 'Hello') for to in users])
+
+        more = sendOutbox()
+        sent = mail_stub.get_sent_messages()
+        check(len(sent) <= per_run, 'first run sends at most %d digests (sent %d)'
+              % (per_run, len(sent)))
+        check(more, 'first run reports more mails pending')
+        digests = mail_stub.get_sent_messages(to=ORGANIZER)
+        check(len(digests) == 1, 'organizer gets one digest (got %d)' % len(digests))
+        check(digests and digests[0].subject == 'You created %d new Conferences!' % conferences,
+              'digest has the plural subject (%r)' % (digests[0].subject if digests else None))
+        pending = set(m.recipient for m in OutboxMail.query())
+        check(ORGANIZER not in pending, "organizer's mails are deleted")
+        check('' not in pending, 'mails to an invalid address are dropped')
+
+        runs = 1
+        while more and runs < 10:
+            more = sendOutbox()
+            runs += 1
+        sent = mail_stub.get_sent_messages()
+        check(len(sent) == 1 + len(users), 'every valid recipient is mailed once (%d of %d)'
+              % (len(sent), 1 + len(users)))
+        check(not OutboxMail.query().count(), 'outbox is empty when no run reports more')
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sdk', default=os.environ.get(
+        'APPENGINE_SDK', '/usr/local/google_appengine'))
+    parser.add_argument('--conferences', type=int, default=3)
+    args = parser.parse_args()
+    harness.setupPath(args.sdk)
+
+    failed = run(args.conferences)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+
+"""datagen.py -- synthetic conferences, sessions, users, registrations and
+wishlists, created through ConferenceApi so derived data (search index,
+seat shards, profiles) is built the way the app builds it.
+
+"""
+
+import random
+from datetime import date, timedelta
+
+from harness import message, signIn
+
+CITIES = ['London', 'Chicago', 'Paris', 'Tokyo', 'Berlin', 'Sydney']
+TOPICS = ['Web Technologies', 'Programming Languages', 'Movie Making',
+          'Health and Nutrition', 'Python', 'Cloud']
+SESSION_TYPES = ['lecture', 'keynote', 'workshop', 'talk']
+WORDS = ['scalable', 'cloud', 'python', 'data', 'mobile', 'design', 'web',
+         'security', 'summit', 'devfest', 'agile', 'testing']
+
+
+class Dataset(object):
+    """Keys and names of generated data, for building benchmark requests."""
+
+    def __init__(self):
+        self.organizers = []
+        self.users = []
+        self.conference_keys = []   # websafe
+        self.session_keys = []      # websafe
+        self.speakers = []
+
+
+def speakerPicker(rng, speakers, skew):
+    """Return a function picking speakers with Zipf-like popularity; skew 0
+    is uniform, larger values concentrate sessions on the first speakers."""
+    weights = [1.0 / (rank ** skew) for rank in range(1, len(speakers) + 1)]
+    total = sum(weights)
+    cumulative, running = [], 0.0
+    for weight in weights:
+        running += weight / total
+        cumulative.append(running)
+
+    def pick():
+        x = rng.random()
+        for speaker, bound in zip(speakers, cumulative):
+            if x <= bound:
+                return speaker
+        return speakers[-1]
+    return pick
+
+
+def generate(api, conferences, sessions_per_conference, users,
+             registrations_per_user=3, wishlist_size=10, speakers=50,
+             speaker_skew=1.2, organizers=5, seed=0):
+    """Populate the testbed datastore and return a Dataset."""
+    from google.appengine.ext import ndb
+    from conference import CONF_GET_REQUEST, SESSIONS_POST_REQUEST
+    from conference import MAX_SESSION_BATCH, WISHLIST_POST_REQUEST
+    from models import Conference, ConferenceForm, Session, SessionForm
+
+    rng = random.Random(seed)
+    data = Dataset()
+    data.speakers = ['Speaker %d' % i for i in range(speakers)]
+    pick_speaker = speakerPicker(rng, data.speakers, speaker_skew)
+    data.organizers = ['organizer%d@example.com' % i for i in range(organizers)]
+    data.users = ['user%d@example.com' % i for i in range(users)]
+
+    first_day = date(2016, 1, 4)
+    for i in range(conferences):
+        signIn(data.organizers[i % organizers])
+        start = first_day + timedelta(days=rng.randint(0, 364))
+        api.createConference(ConferenceForm(
+            name='%s %s %d' % (rng.choice(WORDS).title(), rng.choice(WORDS).title(), i),
+            description=' '.join(rng.choice(WORDS) for _ in range(12)),
+            topics=rng.sample(TOPICS, 2),
+            city=rng.choice(CITIES),
+            startDate=start.isoformat(),
+            endDate=(start + timedelta(days=2)).isoformat(),
+            maxAttendees=rng.choice([50, 100, 500, 1000])))
+    data.conference_keys = [key.urlsafe() for key in
+                            Conference.query().order(Conference.key).fetch(keys_only=True)]
+
+    for i, wsck in enumerate(data.conference_keys):
+        signIn(data.organizers[i % organizers])
+        conf_start = ndb.Key(urlsafe=wsck).get().startDate
+        forms = []
+        for j in range(sessions_per_conference):
+            forms.append(SessionForm(
+                name='Session %d' % j,
+                highlights=' '.join(rng.choice(WORDS) for _ in range(8)),
+                speaker=pick_speaker(),
+                duration='0%d:%s' % (rng.randint(0, 2), rng.choice(['00', '30'])),
+                typeOfSession=rng.choice(SESSION_TYPES),
+                date=(conf_start + timedelta(days=rng.randint(0, 2))).isoformat(),
+                start_time='%02d:00' % rng.randint(8, 21)))
+        for k in range(0, len(forms), MAX_SESSION_BATCH):
+            api.createSessions(message(
+                SESSIONS_POST_REQUEST, websafeConferenceKey=wsck,
+                sessions=forms[k:k + MAX_SESSION_BATCH]))
+    data.session_keys = [key.urlsafe() for key in
+                         Session.query().fetch(keys_only=True)]
+
+    for email in data.users:
+        signIn(email)
+        for wsck in rng.sample(data.conference_keys,
+                               min(registrations_per_user, len(data.conference_keys))):
+            api.registerForConference(message(
+                CONF_GET_REQUEST, websafeConferenceKey=wsck))
+        for sk in rng.sample(data.session_keys,
+                             min(wishlist_size, len(data.session_keys))):
+            api.addSessionToWishlist(message(WISHLIST_POST_REQUEST, sessionkey=sk))
+    return data
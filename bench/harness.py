@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+
+"""harness.py -- run ConferenceApi in-process on the App Engine testbed
+stubs (datastore, memcache, taskqueue, mail), with no network, and measure
+latency and API RPCs per call.
+
+"""
+
+import collections
+import os
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.abspath(os.path.join(HERE, os.pardir, '00_Conference_Central'))
+AUTH_DOMAIN = 'gmail.com'
+
+
+def setupPath(sdk):
+    """Put the App Engine SDK, its bundled libraries and the app on sys.path."""
+    sys.path.insert(0, sdk)
+    import dev_appserver
+    dev_appserver.fix_sys_path()
+    sys.path.insert(0, APP_DIR)
+
+
+class Testbed(object):
+    """Activate fresh service stubs for one benchmark run."""
+
+    def __enter__(self):
+        from google.appengine.datastore import datastore_stub_util
+        from google.appengine.ext import ndb
+        from google.appengine.ext import testbed
+
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.setup_env(app_id='bench', auth_domain=AUTH_DOMAIN,
+                               overwrite=True)
+        # strongly consistent so runs are repeatable
+        policy = datastore_stub_util.PseudoRandomHRConsistencyPolicy(probability=1)
+        self.testbed.init_datastore_v3_stub(consistency_policy=policy)
+        self.testbed.init_memcache_stub()
+        self.testbed.init_taskqueue_stub(root_path=APP_DIR)
+        self.testbed.init_mail_stub()
+        self.testbed.init_app_identity_stub()
+        self.testbed.init_urlfetch_stub()
+        ndb.get_context().clear_cache()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.testbed.deactivate()
+
+
+class RpcCounter(object):
+    """Count API calls ('service.Method') made through the apiproxy."""
+
+    def __init__(self):
+        self.counts = collections.Counter()
+        self.enabled = False
+        from google.appengine.api import apiproxy_stub_map
+        apiproxy_stub_map.apiproxy.GetPreCallHooks().Append(
+            'bench_rpc_counter', self._hook)
+
+    def _hook(self, service, call, request, response):
+        if self.enabled:
+            self.counts['%s.%s' % (service, call)] += 1
+
+    def reset(self):
+        self.counts.clear()
+
+
+def signIn(email):
+    """Make endpoints.get_current_user() return the user with email."""
+    os.environ['ENDPOINTS_AUTH_EMAIL'] = email
+    os.environ['ENDPOINTS_AUTH_DOMAIN'] = AUTH_DOMAIN
+
+
+def message(container, **fields):
+    """Build the request message for an endpoints method taking container,
+    a ResourceContainer or a plain message class."""
+    message_class = getattr(container, 'combined_message_class', container)
+    return message_class(**fields)
+
+
+def measure(call, repeat, counter):
+    """Run call() repeat times in fresh ndb contexts.
+
+    The first run starts with an empty memcache and is reported on its own
+    as 'cold'; the rest are 'warm'. RPC counts are per call, from the first
+    warm run (or the cold one when repeat is 1).
+    """
+    from google.appengine.api import memcache
+    from google.appengine.ext import ndb
+
+    memcache.flush_all()
+    timings, rpcs = [], {}
+    for i in range(repeat):
+        ndb.get_context().clear_cache()
+        counter.reset()
+        counter.enabled = True
+        start = time.time()
+        try:
+            call()
+            ndb.get_context().flush().get_result()
+        finally:
+            elapsed = time.time() - start
+            counter.enabled = False
+        timings.append(elapsed * 1000)
+        if i == min(1, repeat - 1):
+            rpcs = dict(counter.counts)
+    warm = sorted(timings[1:]) or timings
+    return {
+        'cold_ms': round(timings[0], 3),
+        'median_ms': round(warm[len(warm) // 2], 3),
+        'p90_ms': round(warm[min(len(warm) - 1, int(len(warm) * 0.9))], 3),
+        'min_ms': round(warm[0], 3),
+        'rpcs': rpcs,
+        'rpc_total': sum(rpcs.values()),
+    }